@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import weakref
+from collections import OrderedDict
+
+from .MyelinatedFiber import MyelinatedFiber
+
+
+class FiberPool:
+    """ Pool of built fiber models, reused across simulations sharing the same
+    morphology instead of rebuilding all their sections each time.
+
+    Fibers are keyed by class and constructor arguments, and the least recently used
+    ones are discarded (and released from their owners) beyond a maximal pool size. Note that all fibers kept in the
+    pool remain part of the NEURON model, and are therefore integrated in every run:
+    the pool size should only be increased if simulations alternate between a few
+    morphologies.
+    """
+
+    def __init__(self, maxSize=1):
+        """ Object initialization.
+
+        Keyword arguments:
+        maxSize -- maximal number of fibers kept in the pool (default 1)
+        """
+        self.maxSize = maxSize
+        self._fibers = OrderedDict()
+        self._owners = {}
+
+    def __len__(self):
+        return len(self._fibers)
+
+    def get(self, owner=None, fiberClass=MyelinatedFiber, **kwargs):
+        """ Return a fiber with the requested morphology, building it only if needed.
+
+        Keyword arguments:
+        owner -- object using the fiber, whose reset() method is called when another
+        owner acquires the same fiber or when the fiber is evicted from the pool (default
+        None)
+        fiberClass -- class of the fiber (default MyelinatedFiber)
+        kwargs -- fiber constructor arguments
+        """
+        key = (fiberClass, tuple(sorted(
+            (name, tuple(sorted(value.items())) if isinstance(value, dict) else value)
+            for name, value in kwargs.items())))
+        if key in self._fibers:
+            self._fibers.move_to_end(key)
+        else:
+            self._fibers[key] = fiberClass(**kwargs)
+            while len(self._fibers) > self.maxSize:
+                oldKey, _ = self._fibers.popitem(last=False)
+                self._release(oldKey)
+
+        # Release the fiber from its previous owner
+        self._release(key, owner)
+        self._owners[key] = weakref.ref(owner) if owner is not None else None
+        return self._fibers[key]
+
+    def clear(self):
+        """ Remove all fibers from the pool, releasing them from their owners. """
+        for key in list(self._owners):
+            self._release(key)
+        self._fibers.clear()
+
+    def _release(self, key, newOwner=None):
+        """ Release a fiber from its current owner (if any, and other than newOwner) by
+        resetting it, so that no stimulation, detection or recording object of the owner
+        remains attached to the fiber. """
+        previousOwner = self._owners.pop(key, None)
+        previousOwner = previousOwner() if previousOwner is not None else None
+        if previousOwner is not None and previousOwner is not newOwner:
+            previousOwner.reset()
+
+
+fiberPool = FiberPool()
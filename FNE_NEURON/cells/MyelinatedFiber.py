@@ -5,15 +5,96 @@
 # @Last Modified by:   Theo Lemaire
 # @Last Modified time: 2021-02-12 17:30:16
 
+import os
+
 from neuron import h
 import numpy as np
-import pandas as pd
-from scipy.interpolate import interp1d
 
 from .Cell import Cell
+from . import morphology
 from ..utils import load_mechanisms, getNmodlDir
 
 
+# Whether the mechanisms library has been loaded and configured by load_fiber_mechanisms
+mechanismsLoaded = False
+
+
+# Hoc template connecting and configuring the sections of a fiber in bulk: sections are
+# created from Python (to be named after their fiber) and passed as section lists of
+# each type, along with the list of all sections ordered along the fiber, each section
+# being connected by its 0 end to the 1 end of the next one. The properties of each
+# section type are passed as vectors ordered as MyelinatedFiber.propertyKeys.
+# Parameters of the extracellular layers are set separately, since setting them after
+# inserting mechanisms triggers an update of the data of all existing sections
+sectionsTemplate = '''
+begintemplate MyelinatedFiberSections
+public connect_sections, set_properties, set_extracellular_properties
+objref node, mysa, flut, stin, chain
+
+proc init() {
+    node = $o1 mysa = $o2 flut = $o3 stin = $o4 chain = $o5
+}
+
+proc connect_sections() { local first  localobj child
+    first = 1
+    forsec chain {
+        if (!first) { connect child.sec(0), 1 }
+        child = new SectionRef()
+        first = 0
+    }
+}
+
+proc set_type_properties() { local n, d, l, ra, c, g, e
+    n = $o2.x[0] d = $o2.x[1] l = $o2.x[2] ra = $o2.x[3] c = $o2.x[4] g = $o2.x[5] e = $o2.x[6]
+    forsec $o1 {
+        nseg = n diam = d L = l Ra = ra cm = c
+        if ($3) {
+            insert MRGnode
+        } else {
+            insert pas g_pas = g e_pas = e
+        }
+        insert extracellular
+    }
+}
+
+proc set_properties() {
+    set_type_properties(node, $o1, 1)
+    set_type_properties(mysa, $o2, 0)
+    set_type_properties(flut, $o3, 0)
+    set_type_properties(stin, $o4, 0)
+}
+
+proc set_type_extracellular_properties() { local r, g, c
+    r = $o2.x[7] g = $o2.x[8] c = $o2.x[9]
+    forsec $o1 { xraxial[0] = r xg[0] = g xc[0] = c }
+}
+
+proc set_extracellular_properties() {
+    set_type_extracellular_properties(node, $o1)
+    set_type_extracellular_properties(mysa, $o2)
+    set_type_extracellular_properties(flut, $o3)
+    set_type_extracellular_properties(stin, $o4)
+}
+endtemplate MyelinatedFiberSections
+'''
+
+
+def load_fiber_mechanisms():
+    """ Load the mechanisms library, if not already loaded, and select analytic MRGnode
+    rate constants (NEURON enabling the tables of a mechanism when loading it). """
+    global mechanismsLoaded
+    load_mechanisms(getNmodlDir())
+    if not mechanismsLoaded:
+        h.usetable_MRGnode = 0
+        mechanismsLoaded = True
+
+
+def load_sections_template():
+    """ Define the hoc template of fiber sections, if not already defined. """
+    if not hasattr(h, 'MyelinatedFiberSections'):
+        h(sectionsTemplate)
+
+
 class MyelinatedFiber(Cell):
     """ Neuron Biophysical myelinated fiber model.
 
@@ -21,18 +102,67 @@ class MyelinatedFiber(Cell):
     This extends the McIntyre model to allow any diameter to be used
     """
 
-    def __init__(self, diameter=5):
+    # Whether the rate constants of the MRGnode mechanism are interpolated from
+    # precomputed tables rather than evaluated analytically. NEURON's usetable_MRGnode
+    # flag being process-global, it is cleared when the mechanisms are loaded, and then
+    # only set at the start of each run, from the fibers being simulated (see
+    # set_rate_tables and apply_rate_tables)
+    rateTables = False
+
+    sectionTypes = ('node', 'mysa', 'flut', 'stin')
+
+    # Section properties passed to the hoc template, for each section type
+    propertyKeys = ('nseg', 'diam', 'L', 'Ra', 'cm', 'g_pas', 'e_pas', 'xraxial', 'xg', 'xc')
+
+    # Segment records of the fiber geometry: position (um, the fiber lying along the x
+    # axis), section type code (index in sectionTypes), segment length and diameter
+    # (um), index of the section in the sections list and location within the section
+    geometryDtype = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('type', 'u1'), ('L', 'f8'),
+                              ('diam', 'f8'), ('section', 'i4'), ('loc', 'f8')])
+
+    def __init__(self, diameter=5, nNodes=101, nseg=1):
         """ Object initialization.
 
         Keyword arguments:
         diameter -- fiber diameter in micrometers [3-20]
+        nNodes -- number of nodes of Ranvier, preferably odd for the fiber to be centered
+        on a node (default 101)
+        nseg -- number of segments per section, either for all sections or as a
+        dictionary keyed by section type ('node', 'mysa', 'flut' or 'stin', missing types
+        having a single segment) (default 1)
         """
+        self._build(diameter, nNodes, nseg)
+        self._define_extracellular()
+
+    @classmethod
+    def create_population(cls, diameters, nNodes=101, nseg=1):
+        """ Return fibers of given diameters, built together.
 
-        load_mechanisms(getNmodlDir())
+        Setting the parameters of the extracellular layers of a new fiber triggers an
+        update of the data of all existing sections, so that building fibers one after
+        the other takes a time quadratic in their number. Here, these parameters are
+        set once all fibers are built, for a single update.
+
+        Keyword arguments:
+        diameters -- fiber diameters in micrometers
+        nNodes, nseg -- number of nodes and of segments per section of all fibers (see
+        constructor)
+        """
+        fibers = [cls.__new__(cls) for _ in diameters]
+        for fiber, diameter in zip(fibers, diameters):
+            fiber._build(diameter, nNodes, nseg)
+        for fiber in fibers:
+            fiber._define_extracellular()
+        return fibers
+
+    def _build(self, diameter, nNodes, nseg):
+        """ Build the fiber, except for the parameters of its extracellular layers (see
+        _define_extracellular). """
+        load_fiber_mechanisms()
 
         Cell.__init__(self)
 
-        self._init_parameters(diameter)
+        self._init_parameters(diameter, nNodes, nseg)
         self._create_sections()
         self._build_topology()
         self._define_biophysics()
@@ -48,87 +178,103 @@ class MyelinatedFiber(Cell):
     Specific Methods of this class
     """
 
-    def interpolate(self, x, y):
-        # return np.poly1d(np.polyfit(x, y, 3))
-        return interp1d(x, y, kind='linear', assume_sorted=True, fill_value='extrapolate')
-
-    def _init_parameters(self, diameter):
+    def _init_parameters(self, diameter, nNodes=101, nseg=1):
         """ Initialize all cell parameters. """
 
         # topological parameters
-        self.nNodes = 101
+        if nNodes < 2:
+            raise ValueError('a fiber must have at least two nodes')
+        self.nNodes = int(nNodes)
+        if isinstance(nseg, dict):
+            unknown = set(nseg) - set(self.sectionTypes)
+            if unknown:
+                raise ValueError(f'unknown section types: {", ".join(sorted(unknown))}')
+            self.nseg = {secType: int(nseg.get(secType, 1)) for secType in self.sectionTypes}
+        else:
+            self.nseg = {secType: int(nseg) for secType in self.sectionTypes}
+        if min(self.nseg.values()) < 1:
+            raise ValueError('sections must have at least one segment')
         self._axonNodes = self.nNodes
         self._paraNodes1 = 2 * (self.nNodes - 1)
         self._paraNodes2 = 2 * (self.nNodes - 1)
         self._axonInter = 6 * (self.nNodes - 1)
         self.axonTotal = self.nNodes + self._paraNodes1 + self._paraNodes2 + self._axonInter
 
-        # morphological parameters
+        # morphological parameters, interpolated from experimental data to allow any
+        # diameter (see morphology)
         self.fiberD = diameter
-        self._paraLength1 = 3
-        self._nodeLength = 1.0
-        self._spaceP1 = 0.002
-        self._spaceP2 = 0.004
-        self._spaceI = 0.004
+        self._paraLength1 = morphology.paraLength1
+        self._nodeLength = morphology.nodeLength
+        self._spaceP1 = morphology.spaceP1
+        self._spaceP2 = morphology.spaceP2
+        self._spaceI = morphology.spaceI
+        params = morphology.get_morphology(self.fiberD)
+        self._axonD = float(params['axonD'])
+        self._nodeD = float(params['nodeD'])
+        self._paraD1 = float(params['paraD1'])
+        self._paraD2 = float(params['paraD2'])
+        self._deltax = float(params['deltax'])
+        self._paraLength2 = float(params['paraLength2'])
+        self._nl = float(params['nl'])
+        self._Rpn0 = float(params['Rpn0'])
+        self._Rpn1 = float(params['Rpn1'])
+        self._Rpn2 = float(params['Rpn2'])
+        self._Rpx = float(params['Rpx'])
+        self._interLength = float(params['interLength'])
 
         # electrical parameters
-        self._rhoa = 0.7e6  # Ohm-um
+        self._rhoa = morphology.rhoa  # Ohm-um
         self._mycm = 0.1  # uF/cm2/lamella membrane
         self._mygm = 0.001  # S/cm2/lamella membrane
 
-        # fit the parameters with polynomials to allow any diameter
-        experimentalDiameters = [5.7, 7.3, 8.7, 10.0, 11.5, 12.8, 14.0, 15.0, 16.0]
-        experimentalAxonD = [3.4, 4.6, 5.8, 6.9, 8.1, 9.2, 10.4, 11.5, 12.7]
-        experimentalNodeD = [1.9, 2.4, 2.8, 3.3, 3.7, 4.2, 4.7, 5.0, 5.5]
-        experimentalParaD1 = [1.9, 2.4, 2.8, 3.3, 3.7, 4.2, 4.7, 5.0, 5.5]
-        experimentalParaD2 = [3.4, 4.6, 5.8, 6.9, 8.1, 9.2, 10.4, 11.5, 12.7]
-        experimentalDeltaX = [500, 750, 1000, 1150, 1250, 1350, 1400, 1450, 1500]
-        experimentalParaLength2 = [35, 38, 40, 46, 50, 54, 56, 58, 60]
-        experimentalNl = [80, 100, 110, 120, 130, 135, 140, 145, 150]
-
-        # interpolate
-        fit_axonD = self.interpolate(experimentalDiameters, experimentalAxonD)
-        fit_nodeD = self.interpolate(experimentalDiameters, experimentalNodeD)
-        fit_paraD1 = self.interpolate(experimentalDiameters, experimentalParaD1)
-        fit_paraD2 = self.interpolate(experimentalDiameters, experimentalParaD2)
-        fit_deltax = self.interpolate(experimentalDiameters, experimentalDeltaX)
-        fit_paraLength2 = self.interpolate(experimentalDiameters, experimentalParaLength2)
-        fit_nl = self.interpolate(experimentalDiameters, experimentalNl)
-
-        self._axonD = fit_axonD(self.fiberD)
-        self._nodeD = fit_nodeD(self.fiberD)
-        self._paraD1 = fit_paraD1(self.fiberD)
-        self._paraD2 = fit_paraD2(self.fiberD)
-        self._deltax = fit_deltax(self.fiberD)
-        self._paraLength2 = fit_paraLength2(self.fiberD)
-        self._nl = fit_nl(self.fiberD)
-
-        self._Rpn0 = (self._rhoa * .01) / \
-            (np.pi * ((((self._nodeD / 2) + self._spaceP1)**2) - ((self._nodeD / 2)**2)))
-        self._Rpn1 = (self._rhoa * .01) / \
-            (np.pi * ((((self._paraD1 / 2) + self._spaceP1)**2) - ((self._paraD1 / 2)**2)))
-        self._Rpn2 = (self._rhoa * .01) / \
-            (np.pi * ((((self._paraD2 / 2) + self._spaceP2)**2) - ((self._paraD2 / 2)**2)))
-        self._Rpx = (self._rhoa * .01) / \
-            (np.pi * ((((self._axonD / 2) + self._spaceI)**2) - ((self._axonD / 2)**2)))
-        self._interLength = (self._deltax - self._nodeLength -
-                             (2 * self._paraLength1) - (2 * self._paraLength2)) / 6
-
         self.nodeToNodeDistance = self._nodeLength + 2 * (self._paraLength1 + self._paraLength2) + 6 * self._interLength
         self.totalFiberLength = self._nodeLength * self._axonNodes + self._paraNodes1 * \
             self._paraLength1 + self._paraNodes2 * self._paraLength2 + self._interLength * self._axonInter
 
     def _create_sections(self):
-        """ Create the sections of the cell. """
-
+        """ Create the sections of the cell, and the hoc template instance connecting and
+        configuring them in bulk (see _build_topology, _define_biophysics and
+        _define_extracellular). """
         # NOTE: cell=self is required to tell NEURON of this object.
         self.node = [h.Section(name=f'node{x}', cell=self) for x in range(self._axonNodes)]
         self.mysa = [h.Section(name=f'mysa{x}', cell=self) for x in range(self._paraNodes1)]
         self.flut = [h.Section(name=f'flut{x}', cell=self) for x in range(self._paraNodes2)]
         self.stin = [h.Section(name=f'stin{x}', cell=self) for x in range(self._axonInter)]
-        self.segments = []
-
-        # Positions
+        chain = []
+        for i in range(self._axonNodes - 1):
+            chain += [self.node[i], self.mysa[2 * i], self.flut[2 * i], *self.stin[6 * i:6 * i + 6],
+                      self.flut[2 * i + 1], self.mysa[2 * i + 1]]
+        chain.append(self.node[-1])
+        load_sections_template()
+        self._sectionsTemplate = h.MyelinatedFiberSections(
+            *[h.SectionList(sections) for sections in (self.node, self.mysa, self.flut, self.stin, chain)])
+        self.sections = self.node + self.mysa + self.flut + self.stin
+        self._geometry = self._build_geometry()
+        self._geometry.flags.writeable = False
+
+    @property
+    def geometry(self):
+        """ Read-only structured array describing all segments of the fiber (see
+        geometryDtype), ordered by section type, section and location. """
+        return self._geometry
+
+    @property
+    def segments(self):
+        """ List of [section, x, type, loc] entries of all segments, in geometry order. """
+        geometry = self._geometry
+        return [[self.sections[i], x, self.sectionTypes[code], loc]
+                for i, x, code, loc in zip(geometry['section'].tolist(), geometry['x'].tolist(),
+                                           geometry['type'].tolist(), geometry['loc'].tolist())]
+
+    def get_nrn_segments(self):
+        """ Return the NEURON segments of the fiber, in geometry order. """
+        sections = self.sections
+        return [sections[i](loc) for i, loc in zip(self._geometry['section'].tolist(),
+                                                   self._geometry['loc'].tolist())]
+
+    def _get_positions(self):
+        """ Return the positions (in um) of the node, MYSA, FLUT and STIN sections along
+        the fiber, centered on the middle node. """
         delta_node_mysa = 0.5 * (self._nodeLength + self._paraLength1)
         delta_mysa_flut = 0.5 * (self._paraLength1 + self._paraLength2)
         xnodes = self.nodeToNodeDistance * np.arange(self.nNodes)
@@ -137,72 +283,110 @@ class MyelinatedFiber(Cell):
         xflut = np.ravel(np.column_stack((xmysa[::2] + delta_mysa_flut, xmysa[1::2] - delta_mysa_flut)))
         xref = xflut[::2] + 0.5 * (self._paraLength2 + self._interLength)
         xstin = np.ravel([xref + i * self._interLength for i in range(6)], order='F')
-        for i, node in enumerate(self.node):
-            self.segments.append([node, xnodes[i], 'node'])
-        for i, mysa in enumerate(self.mysa):
-            self.segments.append([mysa, xmysa[i], 'mysa'])
-        for i, flut in enumerate(self.flut):
-            self.segments.append([flut, xflut[i], 'flut'])
-        for i, stin in enumerate(self.stin):
-            self.segments.append([stin, xstin[i], 'stin'])
+        return xnodes, xmysa, xflut, xstin
+
+    def _get_segment_positions(self):
+        """ Return, for each section type, the positions (in um) of all segments along the
+        fiber (in section order) and their normalized locations within their section.
+
+        Sections are oriented towards decreasing positions, since each section is
+        connected by its 0 end to the 1 end of the next section along the fiber.
+        """
+        lengths = [self._nodeLength, self._paraLength1, self._paraLength2, self._interLength]
+        positions = []
+        for secType, xsec, L in zip(self.sectionTypes, self._get_positions(), lengths):
+            loc = (np.arange(self.nseg[secType]) + 0.5) / self.nseg[secType]
+            positions.append((np.ravel(xsec[:, None] + (0.5 - loc) * L), loc))
+        return positions
+
+    def _build_geometry(self):
+        """ Return the geometry array of the fiber segments (see geometryDtype). """
+        properties = self._get_section_properties()
+        counts = [self.nNodes, self._paraNodes1, self._paraNodes2, self._axonInter]
+        offsets = np.cumsum([0] + counts[:-1])
+        parts = []
+        for code, (secType, (x, loc)) in enumerate(zip(self.sectionTypes, self._get_segment_positions())):
+            nseg = self.nseg[secType]
+            part = np.zeros(x.size, dtype=self.geometryDtype)
+            part['x'] = x
+            part['type'] = code
+            part['L'] = properties[secType]['L'] / nseg
+            part['diam'] = properties[secType]['diam']
+            part['section'] = offsets[code] + np.repeat(np.arange(counts[code]), nseg)
+            part['loc'] = np.tile(loc, counts[code])
+            parts.append(part)
+        return np.concatenate(parts)
+
+    def _get_section_properties(self):
+        """ Return the geometrical and electrical properties of each section type. """
+        myelin = {'xg': self._mygm / (self._nl * 2), 'xc': self._mycm / (self._nl * 2)}
+        return {
+            'node': {'diam': self._nodeD, 'L': self._nodeLength, 'Ra': self._rhoa / 10000, 'cm': 2,
+                     'xraxial': self._Rpn0, 'xg': 1e10, 'xc': 0},
+            'mysa': {'diam': self.fiberD, 'L': self._paraLength1,
+                     'Ra': self._rhoa * (1 / (self._paraD1 / self.fiberD)**2) / 10000,
+                     'cm': 2 * self._paraD1 / self.fiberD,
+                     'g_pas': 0.001 * self._paraD1 / self.fiberD, 'e_pas': -80,
+                     'xraxial': self._Rpn1, **myelin},
+            'flut': {'diam': self.fiberD, 'L': self._paraLength2,
+                     'Ra': self._rhoa * (1 / (self._paraD2 / self.fiberD)**2) / 10000,
+                     'cm': 2 * self._paraD2 / self.fiberD,
+                     'g_pas': 0.0001 * self._paraD2 / self.fiberD, 'e_pas': -80,
+                     'xraxial': self._Rpn2, **myelin},
+            'stin': {'diam': self.fiberD, 'L': self._interLength,
+                     'Ra': self._rhoa * (1 / (self._axonD / self.fiberD)**2) / 10000,
+                     'cm': 2 * self._axonD / self.fiberD,
+                     'g_pas': 0.0001 * self._axonD / self.fiberD, 'e_pas': -80,
+                     'xraxial': self._Rpx, **myelin}
+        }
 
     def _define_biophysics(self):
-        """ Assign the membrane properties across the cell. """
-        for node in self.node:
-            node.nseg = 1
-            node.diam = self._nodeD
-            node.L = self._nodeLength
-            node.Ra = self._rhoa / 10000
-            node.cm = 2
-            node.insert('MRGnode')
-            node.insert('extracellular')
-            node.xraxial[0] = self._Rpn0
-            node.xg[0] = 1e10
-            node.xc[0] = 0
-
-        for mysa in self.mysa:
-            mysa.nseg = 1
-            mysa.diam = self.fiberD
-            mysa.L = self._paraLength1
-            mysa.Ra = self._rhoa * (1 / (self._paraD1 / self.fiberD)**2) / 10000
-            mysa.cm = 2 * self._paraD1 / self.fiberD
-            mysa.insert('pas')
-            mysa.g_pas = 0.001 * self._paraD1 / self.fiberD
-            mysa.e_pas = -80
-            mysa.insert('extracellular')
-            mysa.xraxial[0] = self._Rpn1
-            mysa.xg[0] = self._mygm / (self._nl * 2)
-            mysa.xc[0] = self._mycm / (self._nl * 2)
-
-        for flut in self.flut:
-            flut.nseg = 1
-            flut.diam = self.fiberD
-            flut.L = self._paraLength2
-            flut.Ra = self._rhoa * (1 / (self._paraD2 / self.fiberD)**2) / 10000
-            flut.cm = 2 * self._paraD2 / self.fiberD
-            flut.insert('pas')
-            flut.g_pas = 0.0001 * self._paraD2 / self.fiberD
-            flut.e_pas = -80
-            flut.insert('extracellular')
-            flut.xraxial[0] = self._Rpn2
-            flut.xg[0] = self._mygm / (self._nl * 2)
-            flut.xc[0] = self._mycm / (self._nl * 2)
-
-        for stin in self.stin:
-            stin.nseg = 1
-            stin.diam = self.fiberD
-            stin.L = self._interLength
-            stin.Ra = self._rhoa * (1 / (self._axonD / self.fiberD)**2) / 10000
-            stin.cm = 2 * self._axonD / self.fiberD
-            stin.insert('pas')
-            stin.g_pas = 0.0001 * self._axonD / self.fiberD
-            stin.e_pas = -80
-            stin.insert('extracellular')
-            stin.xraxial[0] = self._Rpx
-            stin.xg[0] = self._mygm / (self._nl * 2)
-            stin.xc[0] = self._mycm / (self._nl * 2)
+        """ Assign the membrane properties across the cell, and insert the extracellular
+        layers. """
+        self._sectionsTemplate.set_properties(*self._get_property_vectors())
+
+    def _define_extracellular(self):
+        """ Assign the properties of the extracellular layers across the cell. """
+        self._sectionsTemplate.set_extracellular_properties(*self._get_property_vectors())
+
+    def _get_property_vectors(self):
+        """ Return the vectors of properties (see propertyKeys) of each section type,
+        passed to the hoc template. """
+        properties = self._get_section_properties()
+        return [h.Vector([self.nseg[secType]] + [properties[secType].get(key, 0.) for key in self.propertyKeys[1:]])
+                for secType in self.sectionTypes]
+
+    def get_compartments(self):
+        """ Return the properties of the fiber compartments (one per segment), sorted
+        along the fiber, as a dictionary of arrays: section type, position (um) and
+        geometrical and electrical properties of each segment (with NaN passive
+        parameters at nodes). """
+        properties = self._get_section_properties()
+        geometry = self._build_geometry()
+        geometry = geometry[np.argsort(geometry['x'], kind='stable')]
+        compartments = {'type': np.array(self.sectionTypes)[geometry['type']], 'x': geometry['x'],
+                        'diam': geometry['diam'], 'L': geometry['L']}
+        for key in ['Ra', 'cm', 'g_pas', 'e_pas', 'xraxial', 'xg', 'xc']:
+            values = np.array([properties[secType].get(key, np.nan) for secType in self.sectionTypes], dtype=float)
+            compartments[key] = values[geometry['type']]
+        return compartments
+
+    @classmethod
+    def compartments(cls, diameter=5, nNodes=101, nseg=1):
+        """ Return the compartment properties of a fiber of given diameter, number of
+        nodes and segments (see get_compartments), without building its NEURON sections. """
+        fiber = cls.__new__(cls)
+        fiber._init_parameters(diameter, nNodes, nseg)
+        return fiber.get_compartments()
+
+    def get_morphology_key(self):
+        """ Return a key identifying the fiber morphology and discretization. """
+        return (self.__class__.__name__, float(self.fiberD), self.nNodes,
+                tuple(self.nseg[secType] for secType in self.sectionTypes))
 
     def details(self):
+        import pandas as pd
+
         row_labels = ['node', 'MYSA', 'FLUT', 'STIN']
         col_labels = ['nsec', 'nseg', 'diam', 'L', 'cm', 'Ra', 'xr', 'xg', 'xc']
         d = []
@@ -214,19 +398,74 @@ class MyelinatedFiber(Cell):
 
     def _build_topology(self):
         """ connect the sections together """
-        # childSection.connect(parentSection, [parentX], [childEnd])
-        for i in range(self._axonNodes - 1):
-            self.node[i].connect(self.mysa[2 * i], 1, 0)
-            self.mysa[2 * i].connect(self.flut[2 * i], 1, 0)
-            self.flut[2 * i].connect(self.stin[6 * i], 1, 0)
-            self.stin[6 * i].connect(self.stin[6 * i + 1], 1, 0)
-            self.stin[6 * i + 1].connect(self.stin[6 * i + 2], 1, 0)
-            self.stin[6 * i + 2].connect(self.stin[6 * i + 3], 1, 0)
-            self.stin[6 * i + 3].connect(self.stin[6 * i + 4], 1, 0)
-            self.stin[6 * i + 4].connect(self.stin[6 * i + 5], 1, 0)
-            self.stin[6 * i + 5].connect(self.flut[2 * i + 1], 1, 0)
-            self.flut[2 * i + 1].connect(self.mysa[2 * i + 1], 1, 0)
-            self.mysa[2 * i + 1].connect(self.node[i + 1], 1, 0)
+        self._sectionsTemplate.connect_sections()
+
+    def _all_segments(self):
+        """ Return all the segments of the fiber, ordered by section type. """
+        return [seg for sec in self.node + self.mysa + self.flut + self.stin for seg in sec]
+
+    def get_state(self):
+        """ Return a snapshot of the fiber state variables (membrane and extracellular
+        layers potentials, nodal gating variables) as a dictionary of arrays. """
+        segments = self._all_segments()
+        nodeSegments = [seg for sec in self.node for seg in sec]
+        state = {
+            'v': np.array([seg.v for seg in segments]),
+            'vext0': np.array([seg.vext[0] for seg in segments]),
+            'vext1': np.array([seg.vext[1] for seg in segments])
+        }
+        for x in ['m', 'h', 'p', 's']:
+            state[x] = np.array([getattr(seg, f'{x}_MRGnode') for seg in nodeSegments])
+        return state
+
+    def set_state(self, state):
+        """ Restore the fiber state variables from a snapshot returned by get_state.
+
+        Currents and integrator must then be re-initialized (h.fcurrent or cvode.re_init).
+        """
+        segments = self._all_segments()
+        nodeSegments = [seg for sec in self.node for seg in sec]
+        for seg, v, vext0, vext1 in zip(segments, state['v'], state['vext0'], state['vext1']):
+            seg.v = v
+            seg.vext[0] = vext0
+            seg.vext[1] = vext1
+        for x in ['m', 'h', 'p', 's']:
+            for seg, value in zip(nodeSegments, state[x]):
+                setattr(seg, f'{x}_MRGnode', value)
+
+    def equilibrate(self, vinit=-80, tol=1e-3, chunk=10., maxDuration=500.):
+        """ Integrate the unstimulated fiber until it reaches its resting state and
+        return a snapshot of that state.
+
+        Keyword arguments:
+        vinit -- initial membrane potential in mV (default -80)
+        tol -- maximal change in membrane potential (in mV) over a chunk of integration
+        for the fiber to be considered at rest (default 1e-3)
+        chunk -- duration of each integration chunk in ms (default 10)
+        maxDuration -- maximal integration duration in ms (default 500)
+        """
+        return self.equilibrate_population([self], vinit, tol, chunk, maxDuration)[0]
+
+    @staticmethod
+    def equilibrate_population(fibers, vinit=-80, tol=1e-3, chunk=10., maxDuration=500.):
+        """ Integrate unstimulated fibers together until they all reach their resting
+        state and return snapshots of these states (see equilibrate).
+
+        All sections of the NEURON model being integrated in each run, equilibrating
+        fibers together takes a single run instead of one per fiber.
+        """
+        h.load_file('stdrun.hoc')
+        h.CVode().active(0)
+        apply_rate_tables(fibers)
+        h.finitialize(vinit)
+        states = [fiber.get_state() for fiber in fibers]
+        while h.t < maxDuration:
+            h.continuerun(h.t + chunk)
+            previousStates, states = states, [fiber.get_state() for fiber in fibers]
+            if all(np.abs(state['v'] - previousState['v']).max() < tol
+                   for state, previousState in zip(states, previousStates)):
+                break
+        return states
 
     """
     Redefinition of inherited methods
@@ -241,3 +480,99 @@ class MyelinatedFiber(Cell):
     def is_artificial(self):
         """ Return a flag to check whether the cell is an integrate-and-fire or artificial cell. """
         return 0
+
+
+def set_rate_tables(enabled):
+    """ Select tabulated (slightly faster, within about 0.1% relative error) or analytic
+    (default) rate constants for the MRGnode mechanism of all fibers, from their next
+    run on. """
+    MyelinatedFiber.rateTables = bool(enabled)
+
+
+def apply_rate_tables(fibers):
+    """ Set NEURON's usetable_MRGnode flag, which applies to all MRGnode instances of
+    the process, according to the rate constants evaluation of fibers about to be
+    simulated together.
+
+    Raise a ValueError if the fibers do not all use the same evaluation.
+    """
+    rateTables = {bool(fiber.rateTables) for fiber in fibers}
+    if len(rateTables) > 1:
+        raise ValueError('fibers simulated together must all use either tabulated or analytic rate constants')
+    if rateTables:
+        h.usetable_MRGnode = int(rateTables.pop())
+
+
+def create_unstimulated_copies(fibers):
+    """ Return new fibers with the class, morphology, discretization and rate constants
+    evaluation of given fibers, built together (see MyelinatedFiber.create_population). """
+    copies = [fiber.__class__.__new__(fiber.__class__) for fiber in fibers]
+    for copy, fiber in zip(copies, fibers):
+        copy._build(fiber.fiberD, fiber.nNodes, fiber.nseg)
+        copy.rateTables = fiber.rateTables
+    for copy in copies:
+        copy._define_extracellular()
+    return copies
+
+
+# Resting states of already equilibrated fibers, keyed by morphology, temperature and
+# rate constants evaluation
+restingStates = {}
+
+
+def get_resting_state(fiber, cacheDir=None, **kwargs):
+    """ Return the resting state of a fiber, equilibrating it only if that state is not
+    already available in memory or in the cache directory.
+
+    Keyword arguments:
+    fiber -- MyelinatedFiber object
+    cacheDir -- directory in which resting states are saved as npz files (default None,
+    i.e. resting states are only kept in memory)
+    kwargs -- additional keyword arguments passed to MyelinatedFiber.equilibrate
+    """
+    return get_resting_states([fiber], cacheDir, **kwargs)[0]
+
+
+def get_resting_states(fibers, cacheDir=None, **kwargs):
+    """ Return the resting states of fibers, equilibrating together (see
+    MyelinatedFiber.equilibrate_population) those whose state is not already available
+    in memory or in the cache directory.
+
+    Equilibration integrates the whole NEURON model, including any stimulus attached to
+    the fibers or to other sections. Resting states are therefore computed on new
+    fibers of the same morphology, discretization and rate constants evaluation, to
+    which no stimulus is attached, and which are deleted afterwards.
+
+    Keyword arguments:
+    fibers -- list of MyelinatedFiber objects
+    cacheDir -- directory in which resting states are saved as npz files (default None,
+    i.e. resting states are only kept in memory)
+    kwargs -- additional keyword arguments passed to MyelinatedFiber.equilibrate_population
+    """
+    keys = [fiber.get_morphology_key() + (float(h.celsius), bool(fiber.rateTables)) for fiber in fibers]
+    missing = {}
+    for fiber, key in zip(fibers, keys):
+        if key in restingStates or key in missing:
+            continue
+        fpath = None
+        if cacheDir is not None:
+            name, diameter, nNodes, nseg, celsius, rateTables = key
+            nsegTag = '' if max(nseg) == 1 else '_nseg' + '-'.join(map(str, nseg))
+            fname = f'{name}_{diameter}um_{nNodes}nodes{nsegTag}_{celsius}C{"_tables" if rateTables else ""}_rest.npz'
+
+            fpath = os.path.join(cacheDir, fname)
+        if fpath is not None and os.path.isfile(fpath):
+            with np.load(fpath) as data:
+                restingStates[key] = dict(data)
+        else:
+            missing[key] = (fiber, fpath)
+    if missing:
+        states = MyelinatedFiber.equilibrate_population(
+            create_unstimulated_copies([fiber for fiber, _ in missing.values()]), **kwargs)
+        for (key, (_, fpath)), state in zip(missing.items(), states):
+            restingStates[key] = state
+            if fpath is not None:
+                if not os.path.exists(cacheDir):
+                    os.makedirs(cacheDir)
+                np.savez(fpath, **state)
+    return [restingStates[key] for key in keys]
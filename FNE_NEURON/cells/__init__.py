@@ -1,2 +1,4 @@
 from .Cell import Cell
-from .MyelinatedFiber import MyelinatedFiber
+from .MyelinatedFiber import MyelinatedFiber, get_resting_state, get_resting_states, set_rate_tables, apply_rate_tables
+from .FiberPool import FiberPool, fiberPool
+from .morphology import get_morphology, compute_morphology, morphologyDtype
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+""" Morphological model of MRG myelinated fibers.
+
+Morphological parameters measured by McIntyre et al. (2002) for a set of fiber
+diameters are linearly interpolated (and extrapolated beyond the measured range) to
+any diameter, and the derived periaxonal resistivities and internodal lengths are
+computed from them. Evaluation is vectorized over arrays of diameters and memoized per
+diameter, without requiring NEURON.
+"""
+
+import numpy as np
+
+
+# Fixed morphological parameters (um)
+nodeLength = 1.0
+paraLength1 = 3.
+spaceP1 = 0.002
+spaceP2 = 0.004
+spaceI = 0.004
+
+# Axoplasmic resistivity (Ohm-um)
+rhoa = 0.7e6
+
+# Experimental fiber diameters (um) and corresponding morphological parameters
+experimentalDiameters = np.array([5.7, 7.3, 8.7, 10.0, 11.5, 12.8, 14.0, 15.0, 16.0])
+experimentalParameters = {
+    'axonD': [3.4, 4.6, 5.8, 6.9, 8.1, 9.2, 10.4, 11.5, 12.7],
+    'nodeD': [1.9, 2.4, 2.8, 3.3, 3.7, 4.2, 4.7, 5.0, 5.5],
+    'paraD1': [1.9, 2.4, 2.8, 3.3, 3.7, 4.2, 4.7, 5.0, 5.5],
+    'paraD2': [3.4, 4.6, 5.8, 6.9, 8.1, 9.2, 10.4, 11.5, 12.7],
+    'deltax': [500, 750, 1000, 1150, 1250, 1350, 1400, 1450, 1500],
+    'paraLength2': [35, 38, 40, 46, 50, 54, 56, 58, 60],
+    'nl': [80, 100, 110, 120, 130, 135, 140, 145, 150]
+}
+_experimentalTable = np.array(list(experimentalParameters.values()), dtype=float)
+
+# Morphological records: interpolated parameters (diameters and lengths in um, number
+# of myelin lamellae nl), periaxonal resistivities (MOhm/cm) of the node, MYSA, FLUT and
+# STIN sections, and STIN length (um)
+morphologyDtype = np.dtype([(name, 'f8') for name in experimentalParameters] +
+                           [(name, 'f8') for name in ('Rpn0', 'Rpn1', 'Rpn2', 'Rpx', 'interLength')])
+
+# Morphological records already computed, keyed by fiber diameter
+morphologies = {}
+
+
+def _interpolate(x, xp, table):
+    """ Linearly interpolate the rows of a table sampled at increasing xp, at positions
+    x, extrapolating beyond the end points along the first and last intervals (as
+    scipy's interp1d, intervals being closed on the right). """
+    i = np.clip(np.searchsorted(xp, x) - 1, 0, xp.size - 2)
+    slopes = (table[:, i + 1] - table[:, i]) / (xp[i + 1] - xp[i])
+    return slopes * (x - xp[i]) + table[:, i]
+
+
+def _periaxonal_resistivity(diameter, space):
+    """ Return the resistivity (in MOhm/cm) of the periaxonal space of given width (in
+    um) around a section of given diameter (in um). """
+    return (rhoa * .01) / (np.pi * ((((diameter / 2) + space)**2) - ((diameter / 2)**2)))
+
+
+def compute_morphology(diameters):
+    """ Return the morphological records (see morphologyDtype) of fibers of given
+    diameters (in um), with the shape of diameters. """
+    diameters = np.asarray(diameters, dtype=float)
+    morphology = np.empty(diameters.size, dtype=morphologyDtype)
+    for name, values in zip(experimentalParameters,
+                            _interpolate(diameters.ravel(), experimentalDiameters, _experimentalTable)):
+        morphology[name] = values
+    morphology['Rpn0'] = _periaxonal_resistivity(morphology['nodeD'], spaceP1)
+    morphology['Rpn1'] = _periaxonal_resistivity(morphology['paraD1'], spaceP1)
+    morphology['Rpn2'] = _periaxonal_resistivity(morphology['paraD2'], spaceP2)
+    morphology['Rpx'] = _periaxonal_resistivity(morphology['axonD'], spaceI)
+    morphology['interLength'] = (morphology['deltax'] - nodeLength - (2 * paraLength1) -
+                                 (2 * morphology['paraLength2'])) / 6
+    return morphology.reshape(diameters.shape)
+
+
+def get_morphology(diameters):
+    """ Return the morphological records (see morphologyDtype) of fibers of given
+    diameters (in um), with the shape of diameters, computing those of new diameters
+    at once and memoizing them. """
+    diameters = np.asarray(diameters, dtype=float)
+    keys = diameters.ravel().tolist()
+    missing = list(dict.fromkeys(key for key in keys if key not in morphologies))
+    if missing:
+        morphologies.update(zip(missing, compute_morphology(missing)))
+    morphology = np.array([morphologies[key] for key in keys], dtype=morphologyDtype)
+    return morphology.reshape(diameters.shape)
@@ -7,6 +7,14 @@ TITLE Motor Axon Node channels, cleaned  up
 : responsible for nodal action potential
 : Iterative equations H-H notation rest = -80 mV
 :
+: Rate constants are computed once per node and time step by the rates procedure,
+: at a reference temperature (the Q10 factors being applied in the state
+: equations), and stored per instance so that the mechanism is thread safe. They
+: are tabulated over membrane potential if usetable_MRGnode is set, and evaluated
+: analytically otherwise. Note that this flag applies to all instances, and that
+: the Python API clears it when loading the mechanisms (analytic rates by default)
+: and sets it at the start of each run.
+:
 : This model is described in detail in:
 :
 : McIntyre CC, Richardson AG, and Grill WM. Modeling the excitability of
@@ -16,12 +24,14 @@ TITLE Motor Axon Node channels, cleaned  up
 INDEPENDENT {t FROM 0 TO 1 WITH 1 (ms)}
 
 NEURON {
+	THREADSAFE
 	SUFFIX MRGnode
 	NONSPECIFIC_CURRENT inaf
 	NONSPECIFIC_CURRENT inap
 	NONSPECIFIC_CURRENT iks
 	NONSPECIFIC_CURRENT il
 	RANGE gnafbar, gnapbar, gksbar, gl, ena, ek, el
+	RANGE am, bm, ah, bh, ap, bp, as, bs
 }
 
 
@@ -56,6 +66,14 @@ ASSIGNED {
 	inap	(mA/cm2)
 	iks		(mA/cm2)
 	il      (mA/cm2)
+	am		(/ms)
+	bm		(/ms)
+	ah		(/ms)
+	bh		(/ms)
+	ap		(/ms)
+	bp		(/ms)
+	as		(/ms)
+	bs		(/ms)
 }
 
 BREAKPOINT {
@@ -67,54 +85,45 @@ BREAKPOINT {
 }
 
 DERIVATIVE states {
-	m' = alpham(v) * (1 - m) - betam(v) * m
-	h' = alphah(v) * (1 - h) - betah(v) * h
-	p' = alphap(v) * (1 - p) - betap(v) * p
-	s' = alphas(v) * (1 - s) - betas(v) * s
+	rates(v)
+	m' = q10_mp * (am * (1 - m) - bm * m)
+	h' = q10_h * (ah * (1 - h) - bh * h)
+	p' = q10_mp * (ap * (1 - p) - bp * p)
+	s' = q10_s * (as * (1 - s) - bs * s)
 }
 
 INITIAL {
 	q10_mp = 2.2^((celsius - 20) / 10)
 	q10_h = 2.9^((celsius - 20) / 10)
 	q10_s = 3.0^((celsius - 36)/ 10)
-	m = alpham(v) / (alpham(v) + betam(v))
-	h = alphah(v) / (alphah(v) + betah(v))
-	p = alphap(v) / (alphap(v) + betap(v))
-	s = alphas(v) / (alphas(v) + betas(v))
+	rates(v)
+	m = am / (am + bm)
+	h = ah / (ah + bh)
+	p = ap / (ap + bp)
+	s = as / (as + bs)
 }
 
 FUNCTION vtrap(x, y) {
-    vtrap = x / (exp(x / y) - 1)
-}
-
-FUNCTION alpham (v(mV)) {
-	alpham = q10_mp * 1.86 * vtrap(-(v + mhshift + 18.4), 10.3)
-}
-
-FUNCTION betam (v(mV)) {
-	betam = q10_mp * 0.086 * vtrap(v + mhshift + 22.7, 9.16)
-}
-
-FUNCTION alphah (v(mV)) {
-	alphah = q10_h * 0.062 * vtrap(v + mhshift + 111.0, 11.0)
-}
-
-FUNCTION betah (v(mV)) {
-	betah = q10_h * 2.3 / (1 + exp(-(v + mhshift + 28.8) / 13.4))
-}
-
-FUNCTION alphap (v(mV)) {
-	alphap = q10_mp * 0.01 * vtrap(-(v + 27.), 10.2)
-}
-
-FUNCTION betap (v(mV)) {
-	betap = q10_mp * 0.00025 * vtrap(v + 34., 10.)
-}
-
-FUNCTION alphas (v(mV)) {
-	alphas = q10_s * 0.3 / (1 + exp(-(v - vtraub - 27.) / 5.))
-}
-
-FUNCTION betas (v(mV)) {
-	betas = q10_s * 0.03 / (1 + exp(-(v - vtraub + 10.) / 1.))
+	: x / (exp(x / y) - 1), replaced by its first order expansion around its
+	: removable singularity at x = 0
+	if (fabs(x / y) < 1e-6) {
+		vtrap = y * (1 - x / y / 2)
+	} else {
+		vtrap = x / (exp(x / y) - 1)
+	}
+}
+
+PROCEDURE rates(v(mV)) {
+	: Table spanning the potentials reached under extracellular stimulation, with a
+	: 0.1 mV resolution (rates are clamped to their boundary values outside of it)
+	TABLE am, bm, ah, bh, ap, bp, as, bs DEPEND mhshift, vtraub FROM -250 TO 150 WITH 4000
+
+	am = 1.86 * vtrap(-(v + mhshift + 18.4), 10.3)
+	bm = 0.086 * vtrap(v + mhshift + 22.7, 9.16)
+	ah = 0.062 * vtrap(v + mhshift + 111.0, 11.0)
+	bh = 2.3 / (1 + exp(-(v + mhshift + 28.8) / 13.4))
+	ap = 0.01 * vtrap(-(v + 27.), 10.2)
+	bp = 0.00025 * vtrap(v + 34., 10.)
+	as = 0.3 / (1 + exp(-(v - vtraub - 27.) / 5.))
+	bs = 0.03 / (1 + exp(-(v - vtraub + 10.) / 1.))
 }
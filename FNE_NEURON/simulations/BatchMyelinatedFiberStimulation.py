@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+
+from .waveforms import arbitrary_waveform, monophasic_pulse_train
+from .activation import point_source_field
+from ..cells import MyelinatedFiber
+
+
+class MRGnodeKinetics:
+    """ NumPy implementation of the MRGnode mechanism (fast and persistent Na+, slow K+
+    and leakage currents of the nodes of Ranvier), vectorized over arbitrary arrays of
+    nodes. Parameters and rate functions mirror MRGnode_clean.mod. """
+
+    gnafbar = 3.0  # S/cm2
+    gnapbar = 0.01  # S/cm2
+    gksbar = 0.08  # S/cm2
+    gl = 0.007  # S/cm2
+    ena = 50.0  # mV
+    ek = -90.0  # mV
+    el = -90.0  # mV
+    mhshift = 3.  # mV
+    vtraub = -80.  # mV
+
+    # Potential range (mV) and number of intervals of rate tables, as in MRGnode_clean.mod
+    tableRange = (-250., 150.)
+    tableSize = 4000
+
+    def __init__(self, celsius=36., rateTables=False):
+        """ Object initialization.
+
+        Keyword arguments:
+        celsius -- temperature in Celsius degrees (default 36)
+        rateTables -- whether rate constants are linearly interpolated from tables, as
+        NEURON does when usetable_MRGnode is set (default False)
+        """
+        self.q10_mp = 2.2**((celsius - 20) / 10)
+        self.q10_h = 2.9**((celsius - 20) / 10)
+        self.q10_s = 3.0**((celsius - 36) / 10)
+        self.rateTables = rateTables
+        if rateTables:
+            self._vtable = np.linspace(*self.tableRange, self.tableSize + 1)
+            self._tables = self._reference_rates(self._vtable)
+
+    @staticmethod
+    def vtrap(x, y):
+        """ Return x / (exp(x / y) - 1), replaced by its first order expansion around its
+        removable singularity at x = 0. """
+        x = np.asarray(x, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(np.abs(x / y) < 1e-6, y * (1 - x / y / 2), x / np.expm1(x / y))
+
+    def _reference_rates(self, v):
+        """ Return the (alpha, beta) rate constants (in 1/ms) of the m, h, p and s gates,
+        before temperature scaling. """
+        vtrap = self.vtrap
+        return {
+            'm': (1.86 * vtrap(-(v + self.mhshift + 18.4), 10.3),
+                  0.086 * vtrap(v + self.mhshift + 22.7, 9.16)),
+            'h': (0.062 * vtrap(v + self.mhshift + 111.0, 11.0),
+                  2.3 / (1 + np.exp(-(v + self.mhshift + 28.8) / 13.4))),
+            'p': (0.01 * vtrap(-(v + 27.), 10.2),
+                  0.00025 * vtrap(v + 34., 10.)),
+            's': (0.3 / (1 + np.exp(-(v - self.vtraub - 27.) / 5.)),
+                  0.03 / (1 + np.exp(-(v - self.vtraub + 10.) / 1.)))
+        }
+
+    def rates(self, v):
+        """ Return the (alpha, beta) rate constants (in 1/ms) of the m, h, p and s gates. """
+        if self.rateTables:
+            rates = {key: tuple(np.interp(v, self._vtable, table) for table in tables)
+                     for key, tables in self._tables.items()}
+        else:
+            rates = self._reference_rates(v)
+        q10 = {'m': self.q10_mp, 'h': self.q10_h, 'p': self.q10_mp, 's': self.q10_s}
+        return {key: (q10[key] * a, q10[key] * b) for key, (a, b) in rates.items()}
+
+    def steady_states(self, v):
+        """ Return the steady-state values of all gates at membrane potential v. """
+        return {key: a / (a + b) for key, (a, b) in self.rates(v).items()}
+
+    def update(self, gates, v, dt):
+        """ Integrate gates over a time step at membrane potential v, with the cnexp
+        (exponential Euler) scheme used by NEURON. """
+        for key, (a, b) in self.rates(v).items():
+            tau = a + b
+            gates[key] += (1 - np.exp(-dt * tau)) * (a / tau - gates[key])
+
+    def conductances(self, gates):
+        """ Return the fast Na+, persistent Na+, slow K+ and leakage conductances (S/cm2)
+        and their reversal potentials (mV). """
+        return ((self.gnafbar * gates['m']**3 * gates['h'], self.ena),
+                (self.gnapbar * gates['p']**3, self.ena),
+                (self.gksbar * gates['s'], self.ek),
+                (self.gl, self.el))
+
+
+class BatchMyelinatedFiberStimulation:
+    """ Simulation of the extracellular stimulation of many MRG myelinated fibers at
+    once, integrated in NumPy rather than NEURON.
+
+    Each fiber is the compartment chain of MyelinatedFiber (one compartment per
+    segment), with the double cable structure of NEURON's extracellular mechanism: the
+    periaxonal layer (vext[0]) has its own axial resistance and is connected to the
+    applied extracellular potential through the myelin sheath (or directly at nodes),
+    the outer layer (vext[1]) being tied to the applied potential.
+
+    Equations are integrated with NEURON's fixed time step scheme: backward Euler for
+    potentials, with ionic currents linearized around the previous membrane potential,
+    then exponential Euler for gates at the new membrane potential. The intracellular
+    and periaxonal potentials of all fibers form a single symmetric positive definite
+    banded system (the double cable counterpart of the Hines tridiagonal system),
+    solved at once by a banded Cholesky decomposition at each time step.
+    """
+
+    def __init__(self, diameters, distances, amplitudes, tstop=5., pulseWidth=0.1, frequency=0,
+                 dt=0.01, celsius=36., electrodeOffset=0., rateTables=None, nNodes=101, nseg=1):
+        """ Object initialization.
+
+        Keyword arguments:
+        diameters -- fiber diameters in micrometers
+        distances -- electrode-fiber distances in micrometers
+        amplitudes -- stimulation amplitudes in uA
+        tstop -- simulation duration in ms (default 5)
+        pulseWidth -- pulse width in ms (default 0.1)
+        frequency -- stimulation frequency in Hz (default 0, i.e. a single pulse)
+        dt -- integration time step in ms (default 0.01)
+        celsius -- temperature in Celsius degrees (default 36)
+        electrodeOffset -- electrode position along the fibers in micrometers (default 0)
+        rateTables -- whether gating rate constants are interpolated from tables (default
+        None, i.e. as selected for NEURON fibers by set_rate_tables)
+        nNodes -- number of nodes of each fiber (default 101)
+        nseg -- number of segments per section, as for MyelinatedFiber (default 1), nodes
+        being restricted to a single segment
+
+        Diameters, distances and amplitudes are broadcast against each other, one fiber
+        being simulated for each resulting element.
+        """
+        diameters, distances, amplitudes = np.broadcast_arrays(
+            np.asarray(diameters, dtype=float), np.asarray(distances, dtype=float),
+            np.asarray(amplitudes, dtype=float))
+        self._diameters = diameters.ravel()
+        self._distances = distances.ravel()
+        self._amplitudes = amplitudes.ravel()
+        self._tstop = tstop
+        self._pulseWidth = pulseWidth
+        self._frequency = frequency
+        self._stimStartTime = 1
+        self._electrodeOffset = electrodeOffset
+        self._nNodes = nNodes
+        self._nseg = nseg
+        self.dt = dt
+        if rateTables is None:
+            rateTables = MyelinatedFiber.rateTables
+        self.kinetics = MRGnodeKinetics(celsius, rateTables)
+        self._waveform = None
+        self._recordedNodes = None
+        self._detectionNode = -1
+        self._spikeThreshold = -30.  # mV, as for MyelinatedFiber.connect_to_target
+
+        start = time.time()
+        self._build()
+        self.constructionTime = time.time() - start
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.nFibers} fibers)'
+
+    def _build(self):
+        """ Compute the compartment properties of all fibers. """
+        fibers = [MyelinatedFiber.compartments(diameter, self._nNodes, self._nseg) for diameter in self._diameters]
+        self.nFibers = len(fibers)
+        self.nCompartments = fibers[0]['x'].size
+        for compartments in fibers:
+            if compartments['x'].size != self.nCompartments:
+                raise ValueError('all fibers must have the same number of compartments')
+        prop = {key: np.array([compartments[key] for compartments in fibers])
+                for key in fibers[0] if key != 'type'}
+        self._isNode = fibers[0]['type'] == 'node'
+        self.nNodes = int(self._isNode.sum())
+        if self.nNodes != self._nNodes:
+            raise ValueError('nodes must have a single segment')
+        self._x = prop['x']
+
+        area = np.pi * prop['diam'] * prop['L'] * 1e-8  # cm2
+        self._nodeArea = area[:, self._isNode]
+
+        # Membrane and myelin capacitances (nF) and conductances (uS)
+        self._cm = prop['cm'] * area * 1e3
+        self._gpas = np.nan_to_num(prop['g_pas']) * area * 1e6
+        self._epas = np.nan_to_num(prop['e_pas'])
+        self._cmy = prop['xc'] * area * 1e3
+        self._gmy = prop['xg'] * area * 1e6
+
+        # Axial conductances (uS) between neighbouring compartments, through the
+        # zero-area junction of the two half sections
+        rhalf = prop['Ra'] * prop['L'] / 2 * 1e-4 / (np.pi * (prop['diam'] * 1e-4 / 2)**2) * 1e-6  # MOhm
+        self._gi = 1 / (rhalf[:, :-1] + rhalf[:, 1:])
+        xhalf = prop['xraxial'] * prop['L'] / 2 * 1e-4  # MOhm
+        self._gx = 1 / (xhalf[:, :-1] + xhalf[:, 1:])
+
+    def set_waveform(self, t, amp):
+        """ Set an arbitrary stimulus waveform, normalized and scaled by the amplitude of
+        each fiber, overriding the default pulse train.
+
+        Keyword arguments:
+        t -- breakpoint times in ms
+        amp -- relative amplitudes applied from each breakpoint onwards
+        """
+        self._waveform = arbitrary_waveform(t, amp)
+
+    def get_waveform(self):
+        """ Return the breakpoints (t, amp) of the normalized stimulus waveform. """
+        if self._waveform is not None:
+            return self._waveform
+        return monophasic_pulse_train(1., self._pulseWidth, self._frequency, self._stimStartTime, self._tstop)
+
+    def set_recording(self, nodes=None):
+        """ Set the nodes at which membrane potentials are recorded.
+
+        Keyword arguments:
+        nodes -- indexes of the recorded nodes (default None, i.e. all nodes)
+        """
+        self._recordedNodes = nodes
+
+    def get_recorded_nodes(self):
+        """ Return the indexes of the recorded nodes. """
+        if self._recordedNodes is None:
+            return np.arange(self.nNodes)
+        return np.asarray(self._recordedNodes) % self.nNodes
+
+    def _get_unit_field(self):
+        """ Return the extracellular potential (in mV) induced at each compartment of each
+        fiber by a unit (1 uA) point source current. """
+        return point_source_field(self._x, self._distances[:, None], 1., self._electrodeOffset)
+
+    def _assemble(self):
+        """ Return the constant part of the banded system matrix (upper form), for
+        unknowns interleaved as (vi, vext0) per compartment and fibers concatenated one
+        after the other.
+
+        Rows are ordered as [vi_0, vext0_0, vi_1, vext0_1, ...] for each fiber, so that
+        couplings between the two layers of a compartment lie on the first off-diagonals
+        and axial couplings on the second off-diagonals. """
+        nf, nc = self.nFibers, self.nCompartments
+        n = 2 * nf * nc
+        bands = np.zeros((3, n))  # solveh_banded layout: bands[2 + i - j, j] = a[i, j] (i <= j)
+
+        # Axial couplings (no coupling between the last and first compartments of
+        # consecutive fibers)
+        gi = np.zeros((nf, nc))
+        gx = np.zeros((nf, nc))
+        gi[:, :-1] = self._gi
+        gx[:, :-1] = self._gx
+        offdiag = np.stack((gi, gx), axis=-1).ravel()[:-2]  # a[i, i + 2]
+        bands[0, 2:] = -offdiag
+
+        # Axial contributions to the diagonal
+        sumgi = np.zeros((nf, nc))
+        sumgx = np.zeros((nf, nc))
+        sumgi[:, :-1] += self._gi
+        sumgi[:, 1:] += self._gi
+        sumgx[:, :-1] += self._gx
+        sumgx[:, 1:] += self._gx
+        self._axialDiag = (sumgi, sumgx)
+        return bands
+
+    def run(self):
+        """ Run the simulation.
+
+        Membrane potentials of the recorded nodes are stored in the vnodes array (of
+        shape (fibers, nodes, time points)) along with the time vector tvec, and spike
+        times at the end node of each fiber in the spikeTimes list, from which activation
+        flags and latencies are derived.
+        """
+        from scipy.linalg import solveh_banded
+
+        start = time.time()
+        nf, nc, dt = self.nFibers, self.nCompartments, self.dt
+        kinetics = self.kinetics
+        isNode = self._isNode
+
+        # Stimulus: extracellular potentials applied during each time step, taken at
+        # mid-step as NEURON delivers played values
+        nsteps = int(round(self._tstop / dt))
+        tbreak, amp = self.get_waveform()
+        tmid = (np.arange(nsteps) + 0.5) * dt
+        stimAmp = amp[np.searchsorted(tbreak, tmid, side='right') - 1]
+        unitField = self._get_unit_field() * self._amplitudes[:, None]
+
+        # Initial state: uniform membrane potential of -80 mV, gates at steady state
+        vm = np.full((nf, nc), -80.)
+        vext0 = np.zeros((nf, nc))
+        e = np.zeros((nf, nc))
+        gates = kinetics.steady_states(vm[:, isNode])
+
+        bands = self._assemble()
+        sumgi, sumgx = self._axialDiag
+        recordedNodes = self.get_recorded_nodes()
+        nodeIndexes = np.nonzero(isNode)[0]
+        self.tvec = np.arange(nsteps + 1) * dt
+        self.vnodes = np.empty((nf, recordedNodes.size, nsteps + 1))
+        self.vnodes[:, :, 0] = vm[:, nodeIndexes[recordedNodes]]
+        detectionIndex = nodeIndexes[self._detectionNode]
+        spikes = [[] for _ in range(nf)]
+        above = vm[:, detectionIndex] >= self._spikeThreshold
+
+        cdt = self._cm / dt
+        cmydt = self._cmy / dt
+        for i in range(nsteps):
+            enew = stimAmp[i] * unitField
+
+            # Ionic currents (nA) and conductances (uS), linearized around vm
+            g = self._gpas.copy()
+            iion = self._gpas * (vm - self._epas)
+            vnodes = vm[:, isNode]
+            gnode = np.zeros_like(vnodes)
+            inode = np.zeros_like(vnodes)
+            for gx, ex in kinetics.conductances(gates):
+                gnode += gx
+                inode += gx * (vnodes - ex)
+            g[:, isNode] = gnode * self._nodeArea * 1e6
+            iion[:, isNode] = inode * self._nodeArea * 1e6
+
+            # Backward Euler system for the new (vi, vext0) potentials
+            A = cdt + g
+            B = cmydt + self._gmy
+            diag = np.stack((A + sumgi, A + B + sumgx), axis=-1).ravel()
+            coupling = np.stack((-A, np.zeros_like(A)), axis=-1).ravel()[:-1]  # a[i, i + 1]
+            bands[2] = diag
+            bands[1, 1:] = coupling
+            rhsi = A * vm - iion
+            rhsx = -A * vm + iion + cmydt * (vext0 - e + enew) + self._gmy * enew
+            rhs = np.stack((rhsi, rhsx), axis=-1).ravel()
+            solution = solveh_banded(bands, rhs, check_finite=False)
+            vi, vext0 = solution.reshape(nf, nc, 2).transpose(2, 0, 1)
+            vm = vi - vext0
+            e = enew
+
+            # Gates at the new membrane potential
+            kinetics.update(gates, vm[:, isNode], dt)
+
+            self.vnodes[:, :, i + 1] = vm[:, nodeIndexes[recordedNodes]]
+            crossed = vm[:, detectionIndex] >= self._spikeThreshold
+            for j in np.nonzero(crossed & ~above)[0]:
+                spikes[j].append(self.tvec[i + 1])
+            above = crossed
+
+        self.spikeTimes = [np.array(x) for x in spikes]
+        on = np.nonzero(amp)[0]
+        tonset = tbreak[on[0]] if on.size > 0 else 0.
+        self.latencies = np.array([x[0] - tonset if x.size > 0 else np.nan for x in self.spikeTimes])
+        self.activated = ~np.isnan(self.latencies)
+        self.simulationTime = time.time() - start
+        print(f'tot simulation time (batch run, {nf} fibers): {self.simulationTime:.2f} s')
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+from neuron import h
+
+import os
+import time
+import weakref
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .Simulation import Simulation
+from .MyelinatedFiberStimulation import MyelinatedFiberStimulation
+from .fields import place_on_trajectory
+from ..cells import MyelinatedFiber, get_resting_states, apply_rate_tables
+
+
+class MyelinatedFiberPopulationStimulation(MyelinatedFiberStimulation):
+    """ Simulation to asses the recruitment of a population of myelinated fibers of
+    various diameters by extracellular stimulation.
+
+    All fibers run in a single NEURON model. They lie parallel to the x axis (or to the
+    nerve trajectory translated by their position, see set_trajectory) at given (y, z)
+    positions of the nerve cross-section, the point source electrode being located at
+    (electrodeOffset, 0, 0) unless a multi-contact electrode is set. The stimulus is
+    always played as a waveform (see stimMode). Only spike times at the detection nodes
+    of each fiber are recorded, from which activation flags and latencies are computed.
+
+    NEURON cannot integrate the extracellular mechanism with multiple threads, hence
+    large populations are best split across processes with simulate_population.
+    """
+
+    def __init__(self, diameters, positions, amplitude, frequency, tstop=10, pulseWidth=0.1,
+                 integrationMethod='fixed', atol=1e-3, rtol=0., nNodes=101, nseg=1):
+        """ Object initialization.
+
+        Keyword arguments:
+        diameters -- fiber diameters in micrometers
+        positions -- (y, z) coordinates of the fibers in the cross-section, in micrometers
+        amplitude -- stimulation amplitude in uA
+        frequency -- stimulation frequency in Hz
+        tstop -- simulation duration in ms (default 10)
+        pulseWidth -- pulse width in ms (default 0.1)
+        nNodes -- number of nodes of each fiber (default 101)
+        nseg -- number of segments per section (see MyelinatedFiber, default 1)
+        """
+        self._diameters = np.asarray(diameters, dtype=float)
+        self.positions = np.asarray(positions, dtype=float)
+        if self.positions.shape != (self._diameters.size, 2):
+            raise ValueError('positions must be given as one (y, z) pair per fiber')
+        super().__init__(None, amplitude, frequency, tstop, pulseWidth, integrationMethod, atol, rtol,
+                         nNodes=nNodes, nseg=nseg)
+        self.set_spike_detection()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({len(self.fibers)} fibers)'
+
+    def _create_fiber(self, reuseFiber):
+        self.fibers = MyelinatedFiber.create_population(self._diameters, self._nNodes, self._nseg)
+        self.fiber = None
+
+    def _get_segments(self):
+        return [segment for fiber in self.fibers for segment in fiber.get_nrn_segments()]
+
+    def _get_geometry(self):
+        """ Return the geometry arrays of all fibers, concatenated, laid along the nerve
+        trajectory (if any) and translated to the fiber positions in the cross-section. """
+        geometry = np.concatenate([fiber.geometry for fiber in self.fibers])
+        if self.trajectory is not None:
+            points = place_on_trajectory(self.trajectory, geometry['x'])
+            geometry['x'], geometry['y'], geometry['z'] = points.T
+        sizes = [fiber.geometry.size for fiber in self.fibers]
+        geometry['y'] += np.repeat(self.positions[:, 0], sizes)
+        geometry['z'] += np.repeat(self.positions[:, 1], sizes)
+        return geometry
+
+    def _get_geometry_key(self):
+        trajectory = None if self.trajectory is None else self.trajectory.tobytes()
+        return (self.positions.tobytes(), trajectory)
+
+    @property
+    def stimMode(self):
+        """ Stimulation mode, always 'waveform': the stimulus is played into the fibers
+        (pulses toggled by cvode events are not supported in populations). """
+        return 'waveform'
+
+    @stimMode.setter
+    def stimMode(self, value):
+        if value != 'waveform':
+            raise ValueError(f'unsupported stimulation mode for fiber populations: "{value}" (must be "waveform")')
+
+    def _get_fiber_config(self):
+        """ Return the configuration of the stimulated fibers, with the diameter and
+        cross-section position of each fiber. """
+        return {
+            'nNodes': self.fibers[0].nNodes,
+            'nseg': self.fibers[0].nseg,
+            'rateTables': bool(self.fibers[0].rateTables),
+            'fibers': [{'diameter': diameter, 'position': position}
+                       for diameter, position in zip(self._diameters.tolist(), self.positions.tolist())]
+        }
+
+    def get_metadata(self):
+        """ Return the simulation configuration and run outcome as a dictionary, with the
+        activation flag and latency (in ms, None if not activated) of each fiber. """
+        config = self.get_config()
+        fibers = [dict(fiber, activated=bool(activated), latency=None if np.isnan(latency) else latency)
+                  for fiber, activated, latency in zip(config['fibers'], self.activated, self.latencies.tolist())]
+        return dict(config, **{
+            'fibers': fibers,
+            'nActivated': int(self.activated.sum()),
+            'constructionTime': self.constructionTime,
+            'simulationTime': getattr(self, 'simulationTime', None)
+        })
+
+    def _get_result_arrays(self):
+        """ Return the result arrays of the last run: stimulus trace, latencies, and spike
+        times at each detection node of each fiber. """
+        arrays = {'stim': self.ext_stim_vec, 'latencies': self.latencies}
+        for i, spikes in enumerate(self.spikeTimes):
+            for node, nodeSpikes in zip(self._detectionNodes, spikes):
+                arrays[f'fiber{i}_spikes_node{node}'] = nodeSpikes
+        return arrays
+
+    def _load_results(self, results):
+        """ Set the simulation results from stored results. """
+        self.ext_stim_vec = np.array(results['stim'])
+        self.spikeTimes = [[np.array(results[f'fiber{i}_spikes_node{node}']) for node in self._detectionNodes]
+                           for i in range(len(self.fibers))]
+        self._compute_latencies()
+
+    def set_recording(self, nodes=None, dt=None, dtype=np.float64):
+        raise ValueError('membrane potentials are not recorded in fiber populations')
+
+    def set_spike_detection(self, nodes=None, latencyMargin=1., earlyExit=True):
+        """ Set the nodes at which spikes are detected in each fiber.
+
+        Keyword arguments:
+        nodes -- indexes of the detection nodes, the last one being the outcome node used
+        to compute activation flags and latencies (default None, i.e. the fiber center
+        and end nodes)
+        latencyMargin -- delay (in ms) after stimulus offset within which a spike must
+        be initiated (default 1)
+        earlyExit -- whether to stop the integration if no spike has been detected in
+        any fiber within the latency margin (default True)
+        """
+        nNodes = self.fibers[0].nNodes
+        if nodes is None:
+            nodes = [nNodes // 2, nNodes - 1]
+        self._detectionNodes = [node % nNodes for node in nodes]
+        self._latencyMargin = latencyMargin
+        self._earlyExit = earlyExit
+        self._spikeDetectors = []
+        for fiber in self.fibers:
+            detectors = []
+            for node in self._detectionNodes:
+                nc = fiber.connect_to_target(None, node)
+                spikes = h.Vector()
+                nc.record(spikes)
+                detectors.append((nc, spikes))
+            self._spikeDetectors.append(detectors)
+
+    def _check_initiation(self):
+        """ Stop the simulation if no spike has been detected in any fiber. """
+        if not any(len(spikes) for detectors in self._spikeDetectors for _, spikes in detectors):
+            self.stop()
+
+    def _init_events(self):
+        tcheck = self._get_stimulus_offset() + self._latencyMargin
+        if self._earlyExit and tcheck < self._tstop:
+            selfref = weakref.ref(self)
+            self.cvode.event(tcheck, lambda: selfref()._check_initiation())
+
+    def use_resting_state(self, cacheDir=None):
+        """ Start every run from the resting states of the fibers (see
+        MyelinatedFiberStimulation.use_resting_state), fibers whose resting state is not
+        already available being equilibrated together.
+
+        Keyword arguments:
+        cacheDir -- directory in which resting states are saved (default None, i.e.
+        resting states are only kept in memory)
+        """
+        self._clear_waveform()
+        self._restingState = get_resting_states(self.fibers, cacheDir)
+
+    def _init_state(self):
+        if self._restingState is not None:
+            for fiber, state in zip(self.fibers, self._restingState):
+                fiber.set_state(state)
+            if self.cvode.active():
+                self.cvode.re_init()
+            else:
+                h.fcurrent()
+            h.frecord_init()
+
+    def run(self, stepwise=False):
+        """ Run the simulation and compute the activation flag and latency of each fiber. """
+        apply_rate_tables(self.fibers)
+        cache = self._resultCache
+        if cache is not None:
+            config = self.get_config()
+            results = cache.get(config)
+            if results is not None:
+                print(f'results read from cache: {results.path}')
+                self._load_results(results)
+                return
+        self._play_waveform()
+        Simulation.run(self, stepwise)
+        self.spikeTimes = [[spikes.as_numpy().copy() for _, spikes in detectors]
+                           for detectors in self._spikeDetectors]
+        self._compute_latencies()
+        if cache is not None:
+            cache.put(config, self.get_metadata(), self._get_result_arrays())
+        if self._autosaveName is not None:
+            self.resultsPath = self.save_results(self._autosaveName)
+
+    def _compute_latencies(self):
+        """ Compute the latency of the first spike at the outcome node of each fiber, with
+        respect to stimulus onset, and the resulting activation flags. """
+        t, amps = self.get_contact_waveforms()
+        on = np.nonzero(np.any(amps != 0, axis=0))[0]
+        tonset = t[on[0]] if on.size > 0 else 0.
+        self.latencies = np.array([
+            spikes[-1][0] - tonset if spikes[-1].size > 0 else np.nan for spikes in self.spikeTimes])
+        self.activated = ~np.isnan(self.latencies)
+        self.propagated = bool(self.activated.any())
+
+    def plot(self, name="", block=True):
+        """ Plot the fibers of the cross-section, colored according to their activation. """
+        import matplotlib.pyplot as plt
+
+        print('rendering...')
+        fig, ax = plt.subplots(figsize=(6, 6))
+        ax.set_aspect('equal')
+        y, z = self.positions.T
+        ax.scatter(y[~self.activated], z[~self.activated], s=self._diameters[~self.activated]**2,
+                   facecolors='none', edgecolors='dimgray', label='not activated')
+        ax.scatter(y[self.activated], z[self.activated], s=self._diameters[self.activated]**2,
+                   color='#00ADEE', label='activated')
+        contacts = self._get_electrode().positions
+        ax.scatter(contacts[:, 1], contacts[:, 2], marker='x', color='k', label='electrode')
+        ax.set_xlabel('y (um)')
+        ax.set_ylabel('z (um)')
+        ax.set_title(f'{self.activated.sum()}/{self.activated.size} fibers activated')
+        ax.legend(loc='upper right', frameon=False)
+        for key in ['right', 'top']:
+            ax.spines[key].set_visible(False)
+
+        fileName = time.strftime("%Y_%m_%d_neuron_exercise_" + name + ".pdf")
+        plt.savefig(self._get_results_folder() + fileName, format="pdf", transparent=True)
+
+        plt.show(block=block)
+
+
+def _simulate_subpopulation(args):
+    diameters, positions, amplitude, frequency, kwargs = args
+    simulation = MyelinatedFiberPopulationStimulation(diameters, positions, amplitude, frequency, **kwargs)
+    simulation.run()
+    return simulation.latencies
+
+
+def simulate_population(diameters, positions, amplitude, frequency, nprocs=None, chunkSize=None, **kwargs):
+    """ Simulate the stimulation of a fiber population split into sub-populations run
+    in a pool of processes (each owning its own NEURON instance).
+
+    Keyword arguments:
+    diameters -- fiber diameters in micrometers
+    positions -- (y, z) coordinates of the fibers in the cross-section, in micrometers
+    amplitude -- stimulation amplitude in uA
+    frequency -- stimulation frequency in Hz
+    nprocs -- number of worker processes (default None, i.e. number of CPUs)
+    chunkSize -- number of fibers simulated together in each NEURON model (default None,
+    i.e. the population is split evenly across worker processes)
+    kwargs -- additional keyword arguments passed to MyelinatedFiberPopulationStimulation
+
+    Return arrays of activation flags and latencies (in ms, NaN if not activated).
+    """
+    diameters = np.asarray(diameters, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    if chunkSize is None:
+        chunkSize = max(int(np.ceil(diameters.size / (nprocs or os.cpu_count() or 1))), 1)
+    jobs = [(diameters[i:i + chunkSize], positions[i:i + chunkSize], amplitude, frequency, kwargs)
+            for i in range(0, diameters.size, chunkSize)]
+    with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+        latencies = np.concatenate(list(executor.map(_simulate_subpopulation, jobs)))
+    return ~np.isnan(latencies), latencies
+
+
+def random_population(nFibers, meanDiameter=10., stdDiameter=3., radius=500., center=(0., 500.),
+                      minDiameter=3., maxDiameter=20., seed=None):
+    """ Return diameters and cross-section positions of a random fiber population,
+    with normally distributed diameters and positions uniformly distributed in a disk.
+
+    Keyword arguments:
+    nFibers -- number of fibers
+    meanDiameter -- mean fiber diameter in micrometers (default 10)
+    stdDiameter -- standard deviation of fiber diameters in micrometers (default 3)
+    radius -- radius of the fascicle in micrometers (default 500)
+    center -- (y, z) coordinates of the fascicle center in micrometers (default (0, 500))
+    minDiameter -- minimal fiber diameter in micrometers (default 3)
+    maxDiameter -- maximal fiber diameter in micrometers (default 20)
+    seed -- seed of the random number generator (default None)
+    """
+    rng = np.random.default_rng(seed)
+    diameters = np.clip(rng.normal(meanDiameter, stdDiameter, nFibers), minDiameter, maxDiameter)
+    r = radius * np.sqrt(rng.uniform(0, 1, nFibers))
+    theta = rng.uniform(0, 2 * np.pi, nFibers)
+    positions = np.column_stack((r * np.cos(theta), r * np.sin(theta))) + np.asarray(center)
+    return diameters, positions
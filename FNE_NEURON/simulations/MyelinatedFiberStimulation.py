@@ -7,31 +7,51 @@
 
 from neuron import h
 
+import os
 import time
+import weakref
 import numpy as np
-import matplotlib.pyplot as plt
 
 from .Simulation import Simulation
-from ..cells import MyelinatedFiber
+from .waveforms import arbitrary_waveform, monophasic_pulse_train, waveform_trace
+from .results import write_results
+from .electrodes import ElectrodeArray
+from .fields import place_on_trajectory
+from .activation import point_source_field
+from ..cells import MyelinatedFiber, fiberPool, get_resting_state, apply_rate_tables
 
 
 class MyelinatedFiberStimulation(Simulation):
     """ Simulation to asses to effect of extracellular/intracellulra stimulation
     on myelinated fibers. """
 
-    def __init__(self, diameter, amplitude, frequency, tstop=100, pulseWidth=0.1):
-        """ Object initialization. """
-        super().__init__(tstop)
+    def __init__(self, diameter, amplitude, frequency, tstop=100, pulseWidth=0.1,
+                 integrationMethod='fixed', atol=1e-3, rtol=0., outputDt=None, reuseFiber=False,
+                 nNodes=101, nseg=1):
+        """ Object initialization.
+
+        If reuseFiber is set, the fiber is taken from the shared fiber pool instead of
+        being rebuilt, and any other simulation previously using it is reset. The number
+        of nodes and of segments per section (see MyelinatedFiber) set the fiber length
+        and spatial discretization.
+        """
+        super().__init__(tstop, integrationMethod, atol, rtol, outputDt)
 
         # Create the fiber
         self._diameter = diameter
-        self.fiber = MyelinatedFiber(self._diameter)
+        self._nNodes = nNodes
+        self._nseg = nseg
+        start = time.time()
+        self._create_fiber(reuseFiber)
+        self.constructionTime = time.time() - start
         self.fibersPosition = 100  # in um
+        self.trajectory = None  # straight fiber along the x axis
 
         # stimulation parameters
         self._stimStartTime = 1
         self._amplitude = amplitude
         self._electrodeOffset = 0.  # centered to the fiber
+        self.electrode = None  # single point source at the electrode offset
         self._pulseWidth = pulseWidth  # in ms
         if frequency == 0:
             self._frequency = 0.001
@@ -39,25 +59,186 @@ class MyelinatedFiberStimulation(Simulation):
             self._frequency = frequency  # in Hz
         self._stimulationInterval = 1000. / self._frequency  # in ms
 
+        # stimulation mode: 'waveform' (precomputed time course played into the
+        # extracellular mechanism) or 'events' (pulses toggled by cvode events)
+        self.stimMode = 'waveform'
+        self._waveform = None
+        self._playVectors = []
+
         self._stim = False
+        self._unitFieldKey = None
         self._iclampStim = False
         self._secondaryStimObjects = []
         self._syn = []
         self._netcons = []
+        self._detectionNodes = None
+        self._spikeDetectors = []
+        self._outcomeDetector = None
+        self._outcomeSpikes = []
+        self.propagated = False
+        self._restingState = None
+        self._recordedNodes = None
+        self._recordDtype = np.float64
+        self._resultCache = None
+        self._autosaveName = None
+
+    def _create_fiber(self, reuseFiber):
+        """ Create the stimulated fiber, or get it from the fiber pool. """
+        if reuseFiber:
+            self.fiber = fiberPool.get(self, diameter=self._diameter, nNodes=self._nNodes, nseg=self._nseg)
+        else:
+            self.fiber = MyelinatedFiber(self._diameter, self._nNodes, self._nseg)
+
+    def _get_segments(self):
+        """ Return the NEURON segments of all stimulated fibers. """
+        return self.fiber.get_nrn_segments()
+
+    def _get_geometry(self):
+        """ Return the geometry array of all stimulated segments, the fiber either
+        following its trajectory, or lying at fibersPosition from the electrode along
+        the y axis. """
+        geometry = self.fiber.geometry.copy()
+        if self.trajectory is not None:
+            points = place_on_trajectory(self.trajectory, geometry['x'])
+            geometry['x'], geometry['y'], geometry['z'] = points.T
+        else:
+            geometry['y'] += self.fibersPosition
+        return geometry
+
+    def set_trajectory(self, points):
+        """ Lay the fiber along an arbitrary trajectory, e.g. through the grid of an
+        externally computed field, instead of straight along the x axis.
+
+        The fiber is centered on the middle of the trajectory (in curvilinear abscissa),
+        and extends along its first and last edges if longer than the trajectory.
+
+        Keyword arguments:
+        points -- vertices of the trajectory polyline, as (x, y, z) coordinates in
+        micrometers (None to restore the straight fiber at fibersPosition)
+        """
+        self.trajectory = None if points is None else np.asarray(points, dtype=float)
+
+    def set_integration_method(self, method, atol=1e-3, rtol=0.):
+        if method == 'lvardt':
+            raise ValueError('local variable time step is not supported by the extracellular mechanism')
+        super().set_integration_method(method, atol, rtol)
+
+    def _use_daspk(self):
+        # the extracellular mechanism can only be integrated by DASPK with variable time step
+        return True
+
+    def reset(self):
+        """ Detach all stimulation, detection and recording objects from the fiber and
+        reset its extracellular field, so that the fiber can be used by another simulation. """
+        self._clear_waveform()
+        self._stim = False
+        self._iclampStim = False
+        self._secondaryStimObjects = []
+        self._syn = []
+        self._netcons = []
+        self._detectionNodes = None
+        self._spikeDetectors = []
+        self._outcomeDetector = None
+        self._outcomeSpikes = []
+        unitFields = self._get_unit_fields()
+        self._fieldPointers.scatter(h.Vector(unitFields.shape[1]))
+
+    def use_resting_state(self, cacheDir=None):
+        """ Start every run from the resting state of the fiber instead of a uniform
+        -80 mV membrane potential, removing the need for a settling period before the
+        stimulus. The resting state is computed once per fiber morphology and temperature
+        (on an unstimulated copy of the fiber) and restored at each run.
+
+        Keyword arguments:
+        cacheDir -- directory in which resting states are saved (default None, i.e.
+        resting states are only kept in memory)
+        """
+        self._clear_waveform()
+        self._restingState = get_resting_state(self.fiber, cacheDir)
+
+    def _init_state(self):
+        if self._restingState is not None:
+            self.fiber.set_state(self._restingState)
+            if self.cvode.active():
+                self.cvode.re_init()
+            else:
+                h.fcurrent()
+            h.frecord_init()
+
+    def set_amplitude(self, amplitude):
+        """ Set the stimulation amplitude (in uA). """
+        self._amplitude = amplitude
+
+    def set_spike_detection(self, nodes=None, latencyMargin=1., earlyExit=True):
+        """ Switch the simulation to spike detection mode: membrane potentials are not
+        recorded anymore, only spike times at a few detection nodes, and the integration
+        is stopped as soon as its outcome is known, i.e. when an action potential reaches
+        the last detection node (flagged in the propagated attribute), or when no spike
+        has been detected at any node within a latency margin after the end of the
+        stimulus.
+
+        Keyword arguments:
+        nodes -- indexes of the detection nodes, the last one being the outcome node
+        (default None, i.e. the fiber center and end nodes)
+        latencyMargin -- delay (in ms) after stimulus offset within which a spike must
+        be initiated (default 1)
+        earlyExit -- whether to stop the integration once the outcome is known (default
+        True), otherwise spikes are detected until the end of the simulation
+        """
+        if nodes is None:
+            nodes = [self.fiber.nNodes // 2, self.fiber.nNodes - 1]
+        self._detectionNodes = [node % self.fiber.nNodes for node in nodes]
+        self._latencyMargin = latencyMargin
+        self._earlyExit = earlyExit
+        self._spikeDetectors = []
+        for node in self._detectionNodes[:-1]:
+            nc = self.fiber.connect_to_target(None, node)
+            spikes = h.Vector()
+            nc.record(spikes)
+            self._spikeDetectors.append((nc, spikes))
+        self._outcomeDetector = self.fiber.connect_to_target(None, self._detectionNodes[-1])
+        # callbacks hold weak references, to avoid NEURON keeping the simulation (and its
+        # fiber) alive through a reference cycle
+        selfref = weakref.ref(self)
+        self._outcomeDetector.record(lambda: selfref()._on_propagation())
+
+    def _on_propagation(self):
+        self._outcomeSpikes.append(h.t)
+        if not self.propagated:
+            self.propagated = True
+            if self._earlyExit:
+                self.stop()
+
+    def _check_initiation(self):
+        """ Stop the simulation if no spike has been detected at any node. """
+        if not self._outcomeSpikes and not any(len(spikes) for _, spikes in self._spikeDetectors):
+            self.stop()
+
+    def _get_stimulus_offset(self):
+        """ Return the time (in ms) at which the stimulus is turned off for the last time. """
+        t, amps = self.get_contact_waveforms()
+        on = np.nonzero(np.any(amps != 0, axis=0))[0]
+        if on.size == 0:
+            return 0.
+        if on[-1] + 1 < t.size:
+            return t[on[-1] + 1]
+        return np.inf
 
     def Vext(self, r, I):
-        return I / (4 * np.pi * r * 2.) * 1e-3
+        """ Return the extracellular potential (in mV) at a distance r (in m) from a point
+        source of current I (in uA), see point_source_field. """
+        return point_source_field(0., r * 1e6, I)
 
     def toggleStim(self):
         ''' Toggle stim state (ON -> OFF or OFF -> ON) and set appropriate next toggle event. '''
         # OFF -> ON at pulse onset
         if not self._stim:
             self._stim = self.setStimON(True)
-            self.cvode.event(h.t + self._pulseWidth, self.toggleStim)
+            self._schedule_toggle(h.t + self._pulseWidth)
         # ON -> OFF at pulse offset
         else:
             self._stim = self.setStimON(False)
-            self.cvode.event(h.t + self._stimulationInterval - self._pulseWidth, self.toggleStim)
+            self._schedule_toggle(h.t + self._stimulationInterval - self._pulseWidth)
 
         # Re-initialize cvode if active, otherwise update currents
         if self.cvode.active():
@@ -65,33 +246,320 @@ class MyelinatedFiberStimulation(Simulation):
         else:
             h.fcurrent()
 
+    def _schedule_toggle(self, t):
+        ''' Schedule a stim toggle event, weakly referencing the simulation so that the
+        toggle event pending at the end of a run does not keep it alive. '''
+        selfref = weakref.ref(self)
+        self.cvode.event(t, lambda: selfref().toggleStim())
+
     def setStimON(self, value):
         print(f't = {h.t:.2f} ms: turning stimulation {"ON" if value else "OFF"}')
         self._set_field(self._amplitude * int(value))
         return value
 
-    def run(self):
-        tprobe = h.Vector().record(h._ref_t)
-        vprobes = [h.Vector().record(self.fiber.node[j](0.5)._ref_v)
-                   for j in range(self.fiber.nNodes)]
-        self.ext_stim_vec = []
-        self._set_field(0)
-        super().run()
-        self.ext_stim_vec.append([h.t, 0.])
-        self.ext_stim_vec = np.array(self.ext_stim_vec)
-        self.tvec = np.array(tprobe.to_python())
-        self._membranPot = np.array([v.to_python() for v in vprobes])
+    def set_waveform(self, t, amp):
+        """ Set an arbitrary stimulus waveform, overriding the default pulse train.
+
+        Keyword arguments:
+        t -- breakpoint times in ms
+        amp -- amplitudes (in uA) applied from each breakpoint onwards
+        """
+        self._waveform = arbitrary_waveform(t, amp)
+
+    def get_waveform(self):
+        """ Return the breakpoints (t, amp) of the stimulus waveform (or, if the
+        electrode has per-contact waveforms, of the contact with the largest current). """
+        electrode = self._get_electrode()
+        if electrode.has_waveforms():
+            t, amps = electrode.get_waveforms()
+            return t, amps[np.abs(amps).max(axis=1).argmax()]
+        if self._waveform is not None:
+            return self._waveform
+        return monophasic_pulse_train(
+            self._amplitude, self._pulseWidth, self._frequency, self._stimStartTime, self._tstop)
+
+    def get_contact_waveforms(self):
+        """ Return the breakpoint times and the (contacts x breakpoints) current
+        amplitudes (in uA) of all electrode contacts. """
+        electrode = self._get_electrode()
+        if electrode.has_waveforms():
+            return electrode.get_waveforms()
+        return electrode.get_waveforms(*self.get_waveform())
+
+    def set_electrode(self, electrode):
+        """ Set a multi-contact electrode, replacing the default point source.
+
+        The unit field of each contact is computed once per fiber geometry, and
+        superposed at run time according to the contact weights (applied to the
+        stimulus waveform) or per-contact waveforms of the electrode, which can thus be
+        changed between runs at no field computation cost.
+
+        Keyword arguments:
+        electrode -- ElectrodeArray object (None to restore the default point source)
+        """
+        self.electrode = electrode
+
+    def _get_electrode(self):
+        """ Return the stimulating electrode. """
+        if self.electrode is not None:
+            return self.electrode
+        return ElectrodeArray([[self._electrodeOffset, 0., 0.]])
+
+    def _play_waveform(self):
+        """ Play the contact waveforms, superposed through the contact unit fields, into
+        the e_extracellular variable of each fiber segment. """
+        self._clear_waveform()
+        t, amps = self.get_contact_waveforms()
+        fields = self._get_electrode().superpose(self._get_unit_fields(), amps).T
+        self._tplay = h.Vector(t)
+        for segment, values in zip(self._get_segments(), fields):
+            vec = h.Vector(values)
+            vec.play(segment._ref_e_extracellular, self._tplay, 0)
+            self._playVectors.append(vec)
+        self.ext_stim_vec = waveform_trace(*self.get_waveform(), self._tstop)
+
+    def _clear_waveform(self):
+        """ Stop playing the stimulus waveform into the fiber segments. """
+        for vec in self._playVectors:
+            vec.play_remove()
+        self._playVectors = []
+
+    def _init_events(self):
+        if self.stimMode == 'events' and self._amplitude:
+            self._schedule_toggle(self._stimStartTime)
+        if self._detectionNodes is not None and self._earlyExit:
+            tcheck = self._get_stimulus_offset() + self._latencyMargin
+            if tcheck < self._tstop:
+                selfref = weakref.ref(self)
+                self.cvode.event(tcheck, lambda: selfref()._check_initiation())
+
+    def set_recording(self, nodes=None, dt=None, dtype=np.float64):
+        """ Configure the recording of nodal membrane potentials.
+
+        Keyword arguments:
+        nodes -- indexes of the recorded nodes (default None, i.e. all nodes)
+        dt -- recording interval in ms, independent of the integration time step
+        (default None, i.e. every time step with fixed time step integration)
+        dtype -- data type of the recorded traces, e.g. np.float32 to halve memory
+        usage (default np.float64)
+        """
+        self._recordedNodes = nodes
+        self._outputDt = dt
+        self._recordDtype = dtype
+
+    def get_recorded_nodes(self):
+        """ Return the indexes of the recorded nodes. """
+        if self._recordedNodes is None:
+            return np.arange(self.fiber.nNodes)
+        return np.asarray(self._recordedNodes) % self.fiber.nNodes
+
+    def _setup_recording(self):
+        """ Set up vectors recording the membrane potential at each recorded node. """
+        recordDt = self.get_output_dt()
+        self._recordInterval = recordDt if self.integrationMethod == 'fixed' else None
+        if self._recordInterval is None:
+            # Record at every time step
+            self._tprobe = h.Vector().record(h._ref_t)
+            self._vprobes = [h.Vector().record(self.fiber.node[j](0.5)._ref_v)
+                             for j in self.get_recorded_nodes()]
+            bufferSize = int(np.ceil(self._tstop / self.dt)) + 2
+        else:
+            # Record at regular intervals of the fixed time step integration
+            self._tprobe = None
+            self._vprobes = [h.Vector().record(self.fiber.node[j](0.5)._ref_v, self._recordInterval)
+                             for j in self.get_recorded_nodes()]
+            bufferSize = int(np.ceil(self._tstop / self._recordInterval)) + 2
+        for vec in self._vprobes + [self._tprobe]:
+            if vec is not None:
+                vec.buffer_size(bufferSize)
+
+    def _collect_recording(self):
+        """ Copy the recorded traces into a preallocated 2D array, without intermediate
+        conversion to Python lists, and release the recording vectors. """
+        vprobes = [vec.as_numpy() for vec in self._vprobes]
+        if self._recordInterval is None:
+            self.tvec, self._membranPot = self._resample(
+                self._tprobe.as_numpy(), vprobes, dtype=self._recordDtype)
+        else:
+            self.tvec = np.arange(len(vprobes[0])) * self._recordInterval
+            self._membranPot = np.empty((len(vprobes), self.tvec.size), dtype=self._recordDtype)
+            for i, v in enumerate(vprobes):
+                self._membranPot[i] = v
+        self._tprobe, self._vprobes = None, []
+
+    def run(self, stepwise=False):
+        apply_rate_tables([self.fiber])
+        # Secondary stimuli (current clamps, synapses) are not part of the configuration,
+        # hence runs using them are never cached
+        cache = None if self._secondaryStimObjects else self._resultCache
+        if cache is not None:
+            config = self.get_config()
+            results = cache.get(config)
+            if results is not None:
+                print(f'results read from cache: {results.path}')
+                self._load_results(results)
+                return
+        self.propagated = False
+        if self._detectionNodes is None:
+            self._setup_recording()
+        else:
+            self._outcomeSpikes = []
+        if self.stimMode == 'waveform':
+            self._play_waveform()
+            super().run(stepwise)
+        elif self.stimMode == 'events':
+            if self._get_electrode().has_waveforms():
+                raise ValueError('per-contact waveforms can only be played in "waveform" stimulation mode')
+            self._clear_waveform()
+            self.ext_stim_vec = []
+            self._set_field(0)
+            super().run(stepwise)
+            self.ext_stim_vec.append([h.t, self.ext_stim_vec[-1][1]])
+            self.ext_stim_vec = np.array(self.ext_stim_vec)
+        else:
+            raise ValueError(f'unknown stimulation mode: "{self.stimMode}"')
+        if self._detectionNodes is None:
+            self._collect_recording()
+        else:
+            self.spikeTimes = {node: spikes.as_numpy().copy()
+                               for node, (_, spikes) in zip(self._detectionNodes, self._spikeDetectors)}
+            self.spikeTimes[self._detectionNodes[-1]] = np.array(self._outcomeSpikes)
+        if cache is not None:
+            cache.put(config, self.get_metadata(), self._get_result_arrays())
+        if self._autosaveName is not None:
+            self.resultsPath = self.save_results(self._autosaveName)
+
+    def get_config(self):
+        """ Return the full simulation configuration as a dictionary, identifying the
+        results of a run. """
+        config = {
+            'simulation': self.__class__.__name__,
+            **self._get_fiber_config(),
+            'amplitude': self._amplitude,
+            'frequency': self._frequency,
+            'pulseWidth': self._pulseWidth,
+            'stimStartTime': self._stimStartTime,
+            'tstop': self._tstop,
+            'dt': self.dt,
+            'celsius': h.celsius,
+            'integrationMethod': self.integrationMethod,
+            'atol': self._atol,
+            'rtol': self._rtol,
+            'stimMode': self.stimMode,
+            'trajectory': None if self.trajectory is None else self.trajectory.tolist(),
+            'electrodeOffset': self._electrodeOffset,
+            'electrode': None if self.electrode is None else self.electrode.get_config(),
+            'waveform': None if self._waveform is None else [list(x) for x in self._waveform],
+            'restingState': self._restingState is not None
+        }
+        if self._detectionNodes is None:
+            config['recording'] = {
+                'nodes': self.get_recorded_nodes(),
+                'dt': self._outputDt,
+                'dtype': np.dtype(self._recordDtype).str
+            }
+        else:
+            config['detection'] = {
+                'nodes': self._detectionNodes,
+                'latencyMargin': self._latencyMargin,
+                'earlyExit': self._earlyExit
+            }
+        return config
+
+    def _get_fiber_config(self):
+        """ Return the configuration of the stimulated fiber (morphology, discretization
+        and position). """
+        return {
+            'diameter': self._diameter,
+            'nNodes': self.fiber.nNodes,
+            'nseg': self.fiber.nseg,
+            'rateTables': bool(self.fiber.rateTables),
+            'fibersPosition': self.fibersPosition
+        }
+
+    def get_metadata(self):
+        """ Return the simulation configuration and run outcome as a dictionary. """
+        return dict(self.get_config(), **{
+            'propagated': self.propagated,
+            'constructionTime': self.constructionTime,
+            'simulationTime': getattr(self, 'simulationTime', None)
+        })
+
+    def _get_result_arrays(self):
+        """ Return the result arrays of the last run. """
+        arrays = {'stim': self.ext_stim_vec}
+        if self._detectionNodes is None:
+            arrays.update({'t': self.tvec, 'v': self._membranPot})
+        else:
+            for node, spikes in self.spikeTimes.items():
+                arrays[f'spikes_node{node}'] = spikes
+        return arrays
+
+    def _load_results(self, results):
+        """ Set the simulation results from stored results. """
+        self.propagated = results.meta['propagated']
+        self.ext_stim_vec = np.array(results['stim'])
+        if self._detectionNodes is None:
+            self.tvec = np.array(results['t'])
+            self._membranPot = np.array(results['v'])
+        else:
+            self.spikeTimes = {node: np.array(results[f'spikes_node{node}'])
+                               for node in self._detectionNodes}
+
+    def set_result_cache(self, cache):
+        """ Set a result cache from which runs are read back if their configuration has
+        already been simulated, and in which new runs are stored.
+
+        Keyword arguments:
+        cache -- ResultCache object (None to disable caching)
+        """
+        self._resultCache = cache
+
+    def set_autosave(self, name=""):
+        """ Save the results of every subsequent run right after integration (see
+        save_results), the path of the last results directory being stored in the
+        resultsPath attribute.
+
+        Keyword arguments:
+        name -- string to add at predefined directory names (default = "", None to
+        disable saving)
+        """
+        self._autosaveName = name
 
     def save_results(self, name=""):
-        pass
+        """ Save the results of the last run into a new directory of the results folder,
+        as one .npy file per array (time vector, nodal membrane potentials, stimulus
+        trace and spike times) along with a meta.json file of simulation parameters.
+        Results can be read back lazily with load_results. Runs are only saved on
+        request, or after each integration if autosave is set (see set_autosave).
+
+        Keyword arguments:
+        name -- string to add at predefined directory name (default = "").
+
+        Return the path of the results directory.
+        """
+        arrays = self._get_result_arrays()
+        arrays['geometry'] = self._get_geometry()
+        if self._detectionNodes is None:
+            arrays['nodes'] = self.get_recorded_nodes()
+        path = self._get_results_folder() + time.strftime("%Y_%m_%d_%H%M%S_neuron_exercise_" + name)
+        # several runs may be saved within the same second
+        basePath, i = path, 1
+        while os.path.exists(path):
+            path = f'{basePath}_{i}'
+            i += 1
+        return write_results(path, self.get_metadata(), arrays)
 
     def plot(self, name="", block=True):
         """ Plot the simulation results. """
+        import matplotlib.pyplot as plt
+
         print('rendering...')
         fig, ax = plt.subplots(2, figsize=(10, 7), sharex=True)
 
         """ Plot membrane potential in all the nodes as an image"""
-        im = ax[0].pcolormesh(self.tvec, np.arange(self.fiber.nNodes), self._membranPot)
+        recordedNodes = self.get_recorded_nodes()
+        im = ax[0].pcolormesh(self.tvec, recordedNodes, self._membranPot)
 
         fig.subplots_adjust(right=0.8)
         cbax = fig.add_axes([0.85, 0.6, 0.02, 0.3])
@@ -111,9 +579,10 @@ class MyelinatedFiberStimulation(Simulation):
         ax[0].xaxis.set_ticks_position('none')
 
         """ Plot membrane potential in the selected nodes"""
-        nodes = [0, self.fiber.nNodes / 2, self.fiber.nNodes - 1]
-        for node in nodes:
-            ax[1].plot(self.tvec, self._membranPot[int(node), :], label="node: %d" % (node + 1))
+        rows = [0, len(recordedNodes) // 2, len(recordedNodes) - 1]
+        nodes = [recordedNodes[row] for row in rows]
+        for row, node in zip(rows, nodes):
+            ax[1].plot(self.tvec, self._membranPot[row, :], label="node: %d" % (node + 1))
 
         ax[1].legend(loc=9, bbox_to_anchor=(0.95, 0.9))
 
@@ -134,7 +603,7 @@ class MyelinatedFiberStimulation(Simulation):
         ax[1].set_xlabel('Time (ms)')
 
         """ Plot stimulation """
-        if self._amplitude:
+        if np.any(self.ext_stim_vec[:, 1]):
             tvec, Ivec = self.ext_stim_vec.T
 
             fig.subplots_adjust(bottom=0.3)
@@ -188,14 +657,44 @@ class MyelinatedFiberStimulation(Simulation):
             stimAx.get_shared_x_axes().join(stimAx, ax[1])
 
         fileName = time.strftime("%Y_%m_%d_neuron_exercise_" + name + ".pdf")
-        plt.savefig(self._resultsFolder + fileName, format="pdf", transparent=True)
+        plt.savefig(self._get_results_folder() + fileName, format="pdf", transparent=True)
 
         plt.show(block=block)
 
+    def _get_unit_fields(self):
+        """ Return the extracellular potential (in mV) induced at each fiber segment by
+        a unit (1 uA) current at each electrode contact, as a (contacts x segments) array.
+
+        Since the field is linear in contact currents, unit fields are computed once per
+        electrode-fiber geometry and cached, together with a vector of pointers to the
+        e_extracellular variables of all segments.
+        """
+        electrode = self._get_electrode()
+        key = (self._get_geometry_key(), electrode.get_key())
+        if key != self._unitFieldKey:
+            segments = self._get_segments()
+            geometry = self._get_geometry()
+            self._unitFields = electrode.unit_fields(geometry['x'], geometry['y'], geometry['z'])
+            self._fieldPointers = h.PtrVector(len(segments))
+            for i, segment in enumerate(segments):
+                self._fieldPointers.pset(i, segment._ref_e_extracellular)
+            self._unitFieldKey = key
+        return self._unitFields
+
+    def _get_unit_field(self):
+        """ Return the extracellular potential (in mV) induced at each fiber segment per
+        uA of stimulus amplitude, i.e. the unit fields of all contacts superposed
+        according to the contact weights. """
+        return self._get_electrode().superpose(self._get_unit_fields())
+
+    def _get_geometry_key(self):
+        """ Return a key identifying the fiber geometry and position. """
+        trajectory = None if self.trajectory is None else self.trajectory.tobytes()
+        return (id(self.fiber), self.fibersPosition, trajectory)
+
     def _set_field(self, amplitude):
-        for segment in self.fiber.segments:
-            distance = np.sqrt(((segment[1] - self._electrodeOffset) / 1000000.)**2 + (self.fibersPosition / 1000000.)**2)
-            segment[0].e_extracellular = self.Vext(distance, amplitude)
+        field = amplitude * self._get_unit_field()
+        self._fieldPointers.scatter(h.Vector(field))
         if self.ext_stim_vec:
             self.ext_stim_vec.append([h.t, self.ext_stim_vec[-1][1]])
         self.ext_stim_vec.append([h.t, amplitude])
@@ -7,6 +7,7 @@
 
 import os
 import time
+import numpy as np
 from neuron import h
 
 
@@ -17,43 +18,152 @@ class Simulation:
         can be executed in parallel using MPI.
     """
 
-    def __init__(self, tstop):
-        """ Object initialization. """
+    # Available integration methods: fixed time step, global variable time step (CVode)
+    # and local variable time step
+    integrationMethods = ('fixed', 'cvode', 'lvardt')
+
+    def __init__(self, tstop, integrationMethod='fixed', atol=1e-3, rtol=0., outputDt=None):
+        """ Object initialization.
+
+        Keyword arguments:
+        tstop -- simulation duration in ms
+        integrationMethod -- one of 'fixed', 'cvode' or 'lvardt' (default 'fixed')
+        atol -- absolute tolerance of variable time step methods (default 1e-3)
+        rtol -- relative tolerance of variable time step methods (default 0)
+        outputDt -- time step (in ms) of the uniform output grid onto which recorded traces
+        are resampled (default None, i.e. dt if a variable time step method is used and
+        no resampling otherwise)
+        """
         # Simulation parameters
+        h.load_file('stdrun.hoc')
         h.celsius = 36.  # Celsius
-        h.dt = 0.01  # 0.025 (ms)
+        self.dt = 0.01  # 0.025 (ms), fixed time step (also the default output time step)
+        h.dt = self.dt
         self._tstop = tstop  # ms
+        self.set_integration_method(integrationMethod, atol, rtol)
+        self._outputDt = outputDt
 
-        self._resultsFolder = "results/"
-        if not os.path.exists(self._resultsFolder):
-            os.makedirs(self._resultsFolder)
+        self._resultsFolder = "results/"  # created when results are first saved
+
+    def run(self, stepwise=False):
+        """ Run the simulation.
 
-    def run(self):
-        """ Run the simulation. """
+        Keyword arguments:
+        stepwise -- debug mode: advance the integration step by step from Python instead
+        of running it natively with continuerun (default False)
+        """
         # Set integration parameters
-        self.cvode = h.CVode()
-        self.cvode.active(0)
-        print(f'fixed time step integration (dt = {h.dt} ms)')
+        self._init_integrator()
 
         self._start = time.time()
 
         # Initialize
         h.finitialize(-80)
-        if self._amplitude:
-            self.cvode.event(self._stimStartTime, self.toggleStim)
+        h.stoprun = 0
+        self._init_state()
+        self._init_events()
 
         # Integrate
-        while h.t < self._tstop:
-            h.fadvance()
+        if stepwise:
+            while h.t < self._tstop and not h.stoprun:
+                h.fadvance()
+        elif self.cvode.active():
+            # the continuerun loop does not stop at tstop when event callbacks
+            # re-initialize the variable time step integrator
+            self.cvode.solve(self._tstop)
+        else:
+            h.continuerun(self._tstop)
 
         self.simulationTime = time.time() - self._start
-        print("tot simulation time: " + str(int(self.simulationTime)) + "s")
+        print(f'tot simulation time ({"stepwise" if stepwise else "native"} run): {self.simulationTime:.2f} s')
+
+    def stop(self):
+        """ Stop the integration at the end of the current time step. """
+        h.stoprun = 1
+
+    def set_integration_method(self, method, atol=1e-3, rtol=0.):
+        """ Set the integration method.
+
+        Keyword arguments:
+        method -- one of 'fixed', 'cvode' or 'lvardt'
+        atol -- absolute tolerance of variable time step methods (default 1e-3)
+        rtol -- relative tolerance of variable time step methods (default 0)
+        """
+        if method not in self.integrationMethods:
+            raise ValueError(f'unknown integration method: "{method}" (must be one of {self.integrationMethods})')
+        self.integrationMethod = method
+        self._atol = atol
+        self._rtol = rtol
+
+    def _use_daspk(self):
+        """ Return whether variable time step integration requires the DASPK (IDA) solver,
+        e.g. for models using the extracellular mechanism. """
+        return False
+
+    def _init_integrator(self):
+        """ Configure the NEURON integrator according to the selected method. """
+        self.cvode = h.CVode()
+        if self.integrationMethod == 'fixed':
+            # restore the fixed time step, overwritten by variable time step runs
+            self.cvode.active(0)
+            h.dt = self.dt
+            print(f'fixed time step integration (dt = {h.dt} ms)')
+        else:
+            self.cvode.active(1)
+            self.cvode.use_local_dt(int(self.integrationMethod == 'lvardt'))
+            self.cvode.use_daspk(int(self._use_daspk()))
+            if self._use_daspk():
+                # Consistent initialization of the algebraic states after each stimulus
+                # discontinuity by a tiny backward Euler step
+                self.cvode.dae_init_dteps(1e-12, 1)
+            self.cvode.atol(self._atol)
+            self.cvode.rtol(self._rtol)
+            print(f'{"local" if self.integrationMethod == "lvardt" else "global"} variable time step '
+                  f'integration (atol = {self._atol}, rtol = {self._rtol})')
+
+    def get_output_dt(self):
+        """ Return the time step of the output grid, or None if recorded traces are
+        returned without resampling. """
+        if self._outputDt is None and self.integrationMethod != 'fixed':
+            return self.dt
+        return self._outputDt
+
+    def _resample(self, t, y, dtype=np.float64):
+        """ Resample recorded traces onto the uniform output grid (if any), into a
+        preallocated 2D array.
+
+        Keyword arguments:
+        t -- array of recording times
+        y -- list of recorded traces
+        dtype -- data type of the output array (default np.float64)
+        """
+        outputDt = self.get_output_dt()
+        if outputDt is None:
+            tout = t.copy()
+        else:
+            tout = np.arange(0., self._tstop + outputDt / 2, outputDt)
+        yout = np.empty((len(y), tout.size), dtype=dtype)
+        for i, yy in enumerate(y):
+            yout[i] = yy if outputDt is None else np.interp(tout, t, yy)
+        return tout, yout
+
+    def _init_state(self):
+        """ Set model state variables after initialization. """
+        pass
+
+    def _init_events(self):
+        """ Schedule events that must be set after initialization. """
+        pass
 
     def set_results_folder(self, resultsFolderPath):
         """ Set a new folder in which to save the results """
         self._resultsFolder = resultsFolderPath
+
+    def _get_results_folder(self):
+        """ Return the folder in which to save the results, creating it if needed. """
         if not os.path.exists(self._resultsFolder):
             os.makedirs(self._resultsFolder)
+        return self._resultsFolder
 
     def save_results(self, name=""):
         """ Save the simulation results.
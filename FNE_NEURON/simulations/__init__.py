@@ -1,2 +1,15 @@
 from .Simulation import Simulation
 from .MyelinatedFiberStimulation import MyelinatedFiberStimulation
+from .waveforms import *
+from .results import Results, write_results, load_results, list_results
+from .cache import ResultCache
+from .fields import FieldSource, PointSource, GridField, place_on_trajectory
+from .electrodes import ElectrodeArray
+from .BatchMyelinatedFiberStimulation import BatchMyelinatedFiberStimulation, MRGnodeKinetics
+from .MyelinatedFiberPopulationStimulation import MyelinatedFiberPopulationStimulation, simulate_population, random_population
+from .activation import (point_source_field, compute_activating_function, predict_threshold, get_truncated_node_count,
+                         compute_contact_polarizations)
+from .titration import (find_threshold, find_thresholds, fit_strength_duration, strength_duration_curve,
+                        strength_duration_curves, recruitment_curve, discretization_convergence)
+from .lookup import ThresholdTable
+from .sweep import simulate_stimulation, run_sweep
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+""" Persistent content-addressed cache of simulation results.
+
+Runs are stored with write_results under a key hashing the full simulation
+configuration together with the signature of the compiled mechanisms library, so
+that identical runs are read back instead of being integrated again.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+from .results import Results, write_results, _to_builtin
+from ..utils import getNmodlDir, get_mechanisms_signature
+
+
+class ResultCache:
+    """ Size-bounded cache of simulation results, discarding the least recently used
+    runs beyond a maximal size on disk.
+
+    The size of the cache is measured once upon construction and then tracked as runs
+    are stored, the cache being only scanned again (along with runs stored by other
+    processes) when the tracked size exceeds the maximal size.
+
+    The whole cache is invalidated if the mechanisms library differs from the one used
+    to compute the stored results, e.g. after recompiling the MOD files.
+    """
+
+    def __init__(self, folder, maxSize=1e9, mechanismsDir=None):
+        """ Object initialization.
+
+        Keyword arguments:
+        folder -- directory in which results are stored
+        maxSize -- maximal size of the cache on disk, in bytes (default 1e9)
+        mechanismsDir -- directory of the simulated mechanisms (default None, i.e. the
+        package nmodl directory)
+        """
+        self.folder = folder
+        self.maxSize = maxSize
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self._mechanisms = get_mechanisms_signature(mechanismsDir or getNmodlDir())
+        self.check_mechanisms()
+        self._size = self.get_size()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.folder}, {len(self)} runs)'
+
+    def __len__(self):
+        return len(self._get_entries())
+
+    def _get_entries(self):
+        """ Return the paths of all stored runs. """
+        return [os.path.join(self.folder, name) for name in os.listdir(self.folder)
+                if not name.endswith('.tmp') and
+                os.path.isfile(os.path.join(self.folder, name, 'meta.json'))]
+
+    def check_mechanisms(self):
+        """ Invalidate the cache if its results were computed with another build of the
+        mechanisms library. """
+        fpath = os.path.join(self.folder, 'mechanisms.json')
+        if os.path.isfile(fpath):
+            with open(fpath) as fh:
+                if json.load(fh) == self._mechanisms:
+                    return
+            print(f'mechanisms library changed: invalidating result cache in {self.folder}')
+            self.invalidate()
+        with open(fpath, 'w') as fh:
+            json.dump(self._mechanisms, fh, indent=2)
+
+    def invalidate(self):
+        """ Remove all stored runs. """
+        for path in self._get_entries():
+            shutil.rmtree(path, ignore_errors=True)
+        self._size = 0
+
+    def get_key(self, config):
+        """ Return the key of a simulation configuration. """
+        content = json.dumps({'config': config, 'mechanisms': self._mechanisms},
+                             sort_keys=True, default=_to_builtin)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, config):
+        """ Return the stored results of a simulation configuration, or None if the
+        configuration has not been simulated yet. """
+        path = os.path.join(self.folder, self.get_key(config))
+        if not os.path.isfile(os.path.join(path, 'meta.json')):
+            return None
+        os.utime(path)  # mark as recently used
+        return Results(path)
+
+    def put(self, config, meta, arrays):
+        """ Store the results of a simulation configuration and evict the least recently
+        used runs if the cache (as tracked) exceeds its maximal size.
+
+        Keyword arguments:
+        config -- simulation configuration
+        meta -- dictionary of run metadata
+        arrays -- dictionary of result arrays
+        """
+        path = os.path.join(self.folder, self.get_key(config))
+        # Write to a temporary directory first, so that concurrent processes never read
+        # incomplete runs
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        write_results(tmpPath, dict(meta, config=config), arrays)
+        try:
+            os.rename(tmpPath, path)
+            self._size += self.get_size(path)
+        except OSError:  # already stored by another process
+            shutil.rmtree(tmpPath, ignore_errors=True)
+        if self._size > self.maxSize:
+            self.evict()
+        return path
+
+    def get_size(self, path=None):
+        """ Return the size on disk (in bytes) of a stored run, or of the whole cache. """
+        paths = self._get_entries() if path is None else [path]
+        return sum(os.path.getsize(os.path.join(p, name)) for p in paths for name in os.listdir(p))
+
+    def evict(self):
+        """ Scan the cache and remove the least recently used runs until it fits its
+        maximal size. """
+        entries = sorted(self._get_entries(), key=os.path.getmtime)
+        sizes = [self.get_size(path) for path in entries]
+        total = sum(sizes)
+        for path, size in zip(entries, sizes):
+            if total <= self.maxSize:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        self._size = total
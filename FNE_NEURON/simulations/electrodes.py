@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+""" Multi-contact stimulation electrodes.
+
+Electrode contacts are modeled as field sources: point current sources in a
+homogeneous medium, or potential fields computed externally. Since the extracellular
+potential is linear in the contact currents, the potential induced along fibers is
+precomputed once per contact for a unit current (unit fields), and superposed at run
+time for any contact weighting or set of contact waveforms, by matrix products.
+"""
+
+import numpy as np
+
+from .waveforms import arbitrary_waveform
+from .fields import FieldSource, PointSource
+
+
+class ElectrodeArray:
+    """ Multi-contact electrode, driven either by a common stimulus waveform scaled by
+    per-contact weights (current steering), or by arbitrary per-contact waveforms.
+
+    Positions are given in micrometers in the frame of the fibers, which run along the
+    x axis at their (y, z) cross-section position.
+    """
+
+    def __init__(self, contacts, weights=None, sigma=2.):
+        """ Object initialization.
+
+        Keyword arguments:
+        contacts -- contacts given either as (x, y, z) coordinates of point sources in
+        micrometers, or as FieldSource objects (e.g. GridField)
+        weights -- factors scaling the common stimulus waveform at each contact (default
+        None, i.e. 1 at all contacts)
+        sigma -- conductivity of the medium around point sources in S/m (default 2)
+        """
+        if isinstance(contacts, np.ndarray) and contacts.ndim == 1:
+            contacts = [contacts]
+        self.sources = [contact if isinstance(contact, FieldSource) else PointSource(contact, sigma)
+                        for contact in contacts]
+        if not self.sources:
+            raise ValueError('an electrode must have at least one contact')
+        self.sigma = sigma
+        self.set_weights(np.ones(self.nContacts) if weights is None else weights)
+        self._waveforms = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.nContacts} contacts)'
+
+    @property
+    def nContacts(self):
+        return len(self.sources)
+
+    @property
+    def positions(self):
+        """ (x, y, z) coordinates of the contacts (NaN for non-localized sources). """
+        return np.array([source.position if source.position is not None else np.full(3, np.nan)
+                         for source in self.sources])
+
+    @classmethod
+    def cuff(cls, nContacts, radius, x=0., center=(0., 0.), angle=0., **kwargs):
+        """ Return a ring of contacts evenly spaced on the inner surface of a cuff.
+
+        Keyword arguments:
+        nContacts -- number of contacts
+        radius -- cuff radius in micrometers
+        x -- position of the ring along the fibers in micrometers (default 0)
+        center -- (y, z) coordinates of the cuff axis in micrometers (default (0, 0))
+        angle -- angular position of the first contact in radians (default 0)
+        kwargs -- additional keyword arguments passed to the constructor
+        """
+        theta = angle + 2 * np.pi * np.arange(nContacts) / nContacts
+        positions = np.column_stack((np.full(nContacts, x), center[0] + radius * np.cos(theta),
+                                     center[1] + radius * np.sin(theta)))
+        return cls(positions, **kwargs)
+
+    @classmethod
+    def linear(cls, nContacts, pitch, y=0., z=0., x=0., **kwargs):
+        """ Return a linear array of contacts parallel to the fibers, centered on x.
+
+        Keyword arguments:
+        nContacts -- number of contacts
+        pitch -- distance between neighbouring contacts in micrometers
+        y, z -- cross-section coordinates of the array in micrometers (default 0)
+        x -- position of the array center along the fibers in micrometers (default 0)
+        kwargs -- additional keyword arguments passed to the constructor
+        """
+        xcontacts = x + pitch * (np.arange(nContacts) - (nContacts - 1) / 2)
+        positions = np.column_stack((xcontacts, np.full(nContacts, y), np.full(nContacts, z)))
+        return cls(positions, **kwargs)
+
+    def set_weights(self, weights):
+        """ Set the factors scaling the common stimulus waveform at each contact, e.g.
+        (1, -0.5, -0.5) for a tripolar configuration. """
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (self.nContacts,):
+            raise ValueError(f'{self.nContacts} contact weights are required')
+        self.weights = weights
+
+    def set_waveforms(self, waveforms):
+        """ Set arbitrary per-contact waveforms, overriding the common stimulus waveform.
+
+        Keyword arguments:
+        waveforms -- one (t, amp) pair of breakpoint vectors per contact (amplitudes in
+        uA), or None for contacts injecting no current
+        """
+        if len(waveforms) != self.nContacts:
+            raise ValueError(f'{self.nContacts} contact waveforms are required')
+        waveforms = [arbitrary_waveform(*waveform) if waveform is not None else (np.zeros(1), np.zeros(1))
+                     for waveform in waveforms]
+        # Resample all waveforms on the union of their breakpoints
+        t = np.unique(np.concatenate([tk for tk, _ in waveforms]))
+        amps = np.array([ak[np.searchsorted(tk, t, side='right') - 1] for tk, ak in waveforms])
+        self._waveforms = (t, amps)
+
+    def clear_waveforms(self):
+        """ Restore the common stimulus waveform scaled by contact weights. """
+        self._waveforms = None
+
+    def get_waveforms(self, t=None, amp=None):
+        """ Return the breakpoint times and the (contacts x breakpoints) amplitudes (in
+        uA) of the contact currents: the per-contact waveforms if set, or else the
+        common waveform (t, amp) scaled by contact weights. """
+        if self._waveforms is not None:
+            return self._waveforms
+        return t, self.weights[:, None] * np.asarray(amp)[None, :]
+
+    def has_waveforms(self):
+        """ Return whether per-contact waveforms are set. """
+        return self._waveforms is not None
+
+    def unit_fields(self, x, y=0., z=0.):
+        """ Return the extracellular potential (in mV) induced at given positions (in
+        um) by a unit (1 uA) current at each contact, as a (contacts x positions) array. """
+        x, y, z = np.broadcast_arrays(*[np.asarray(u, dtype=float) for u in (x, y, z)])
+        return np.array([source.sample(x, y, z) for source in self.sources])
+
+    def superpose(self, unitFields, currents=None):
+        """ Return the extracellular potential resulting from contact currents, by linear
+        superposition of unit fields.
+
+        Keyword arguments:
+        unitFields -- (contacts x positions) unit fields returned by unit_fields
+        currents -- contact currents in uA, along the first axis (default None, i.e. the
+        contact weights)
+        """
+        if currents is None:
+            currents = self.weights
+        return np.tensordot(np.asarray(currents, dtype=float), unitFields, axes=([0], [0]))
+
+    def get_key(self):
+        """ Return a key identifying the contact geometry (independently of currents). """
+        return tuple(source.get_key() for source in self.sources)
+
+    def get_config(self):
+        """ Return the electrode configuration as a dictionary. """
+        config = {'contacts': [source.get_config() for source in self.sources], 'weights': self.weights.tolist()}
+        if self._waveforms is not None:
+            config['waveforms'] = [x.tolist() for x in self._waveforms]
+        return config
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+""" Sources of extracellular potential fields.
+
+A field source returns the extracellular potential (in mV) induced at arbitrary
+positions by a unit (1 uA) current injected at the corresponding electrode contact.
+Potentials are either analytic (point source in a homogeneous medium) or sampled from
+3D grids computed externally (e.g. by finite element solvers). Grids are stored on disk
+in the results format (one .npy file per array) and memory-mapped, so that only the
+grid cells surrounding fiber segments are ever read.
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .activation import point_source_field
+from .results import Results, write_results
+
+
+class FieldSource:
+    """ Interface of extracellular field sources. """
+
+    # Position of the source, if it is localized (None otherwise)
+    position = None
+
+    def sample(self, x, y, z):
+        """ Return the extracellular potential (in mV) induced at given positions (in um)
+        by a unit (1 uA) source current. """
+        raise Exception("pure virtual function")
+
+    def get_key(self):
+        """ Return a key identifying the field of the source. """
+        raise Exception("pure virtual function")
+
+    def get_config(self):
+        """ Return the source configuration as a dictionary. """
+        raise Exception("pure virtual function")
+
+
+class PointSource(FieldSource):
+    """ Point current source in an infinite homogeneous and isotropic medium. """
+
+    def __init__(self, position=(0., 0., 0.), sigma=2.):
+        """ Object initialization.
+
+        Keyword arguments:
+        position -- (x, y, z) coordinates of the source in micrometers (default origin)
+        sigma -- conductivity of the medium in S/m (default 2)
+        """
+        self.position = np.asarray(position, dtype=float)
+        if self.position.shape != (3,):
+            raise ValueError('source position must be given as an (x, y, z) triplet')
+        self.sigma = sigma
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({", ".join(f"{u:.1f}" for u in self.position)})'
+
+    def sample(self, x, y, z):
+        x0, y0, z0 = self.position
+        distance = np.sqrt((np.asarray(y) - y0)**2 + (np.asarray(z) - z0)**2)
+        return point_source_field(x, distance, electrodeOffset=x0, sigma=self.sigma)
+
+    def get_key(self):
+        return (self.__class__.__name__, self.position.tobytes(), float(self.sigma))
+
+    def get_config(self):
+        return {'type': self.__class__.__name__, 'position': self.position.tolist(), 'sigma': self.sigma}
+
+
+# Grid fields already loaded, keyed by path and modification time
+gridFields = {}
+
+
+class GridField(FieldSource):
+    """ Extracellular potential sampled on a rectilinear 3D grid, trilinearly
+    interpolated at arbitrary positions.
+
+    Samples are cached per set of positions (e.g. per fiber), so that repeated
+    simulations of the same fibers never read the grid again.
+    """
+
+    def __init__(self, x, y, z, potential, scale=1., cacheSize=64, path=None):
+        """ Object initialization.
+
+        Keyword arguments:
+        x, y, z -- increasing grid coordinates along each axis in micrometers
+        potential -- (x, y, z) array of potentials (possibly memory-mapped)
+        scale -- factor converting grid potentials into mV per uA of source current
+        (default 1)
+        cacheSize -- maximal number of cached sample vectors (default 64)
+        path -- directory from which the grid was loaded (default None)
+
+        Grids are assumed not to be modified after construction: the signature
+        identifying their content (see get_signature) is computed only once.
+        """
+        self.axes = [np.asarray(u, dtype=float) for u in (x, y, z)]
+        for name, axis in zip('xyz', self.axes):
+            if axis.ndim != 1 or axis.size < 2 or np.any(np.diff(axis) <= 0):
+                raise ValueError(f'{name} grid coordinates must be increasing, with at least two values')
+        if potential.shape != tuple(axis.size for axis in self.axes):
+            raise ValueError(f'potential shape {potential.shape} does not match grid shape')
+        self.potential = potential
+        self.scale = scale
+        self.cacheSize = cacheSize
+        self.path = path
+        self._samples = OrderedDict()
+        # Files of loaded grids are identified when loaded, so that the signature
+        # describes the data held by the grid even if the files are rewritten later
+        self._signature = None if path is None else self._get_files_signature(path)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({" x ".join(str(axis.size) for axis in self.axes)})'
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """ Load a grid saved by save, memory-mapping its potential array (loaded grids
+        are kept in memory, along with their cached samples, until modified on disk).
+
+        Keyword arguments:
+        path -- grid directory
+        kwargs -- additional keyword arguments passed to the constructor
+        """
+        path = os.path.realpath(path)
+        key = (path, os.path.getmtime(os.path.join(path, 'potential.npy')))
+        if key not in gridFields:
+            results = Results(path)
+            kwargs.setdefault('scale', results.meta.get('scale', 1.))
+            gridFields[key] = cls(np.array(results['x']), np.array(results['y']), np.array(results['z']),
+                                  results['potential'], path=path, **kwargs)
+        return gridFields[key]
+
+    @staticmethod
+    def save(path, x, y, z, potential, scale=1., **meta):
+        """ Save a grid of potentials into a directory, written chunk by chunk.
+
+        Keyword arguments:
+        path -- grid directory
+        x, y, z -- grid coordinates along each axis in micrometers
+        potential -- (x, y, z) array of potentials
+        scale -- factor converting grid potentials into mV per uA of source current
+        (default 1)
+        meta -- additional metadata (e.g. units or solver parameters)
+        """
+        return write_results(path, dict(meta, scale=scale), {'x': x, 'y': y, 'z': z, 'potential': potential})
+
+    def interpolate(self, x, y, z):
+        """ Return the grid potentials (in grid units) trilinearly interpolated at given
+        positions (in um), reading only the surrounding grid cells. """
+        points = np.broadcast_arrays(*[np.asarray(u, dtype=float) for u in (x, y, z)])
+        shape = points[0].shape
+        indexes, weights = [], []
+        for name, axis, u in zip('xyz', self.axes, points):
+            u = u.ravel()
+            if np.any((u < axis[0]) | (u > axis[-1])):
+                raise ValueError(f'positions out of the field grid along {name}')
+            i = np.clip(np.searchsorted(axis, u, side='right') - 1, 0, axis.size - 2)
+            indexes.append(i)
+            weights.append((u - axis[i]) / (axis[i + 1] - axis[i]))
+
+        # Read the corners of all enclosing cells at once
+        (i, j, k), (wx, wy, wz) = indexes, weights
+        corners = self.potential[np.stack([i, i + 1])[:, None, None], np.stack([j, j + 1])[None, :, None],
+                                 np.stack([k, k + 1])[None, None, :]]
+        corners = np.asarray(corners, dtype=float)
+        corners = corners[0] * (1 - wx) + corners[1] * wx
+        corners = corners[0] * (1 - wy) + corners[1] * wy
+        return (corners[0] * (1 - wz) + corners[1] * wz).reshape(shape)
+
+    def sample(self, x, y, z):
+        points = np.ascontiguousarray(np.broadcast_arrays(*[np.asarray(u, dtype=float) for u in (x, y, z)]))
+        key = hashlib.sha1(points.tobytes() + str(points.shape).encode()).hexdigest()
+        if key in self._samples:
+            self._samples.move_to_end(key)
+        else:
+            self._samples[key] = self.scale * self.interpolate(*points)
+            while len(self._samples) > self.cacheSize:
+                self._samples.popitem(last=False)
+        return self._samples[key]
+
+    @staticmethod
+    def _get_files_signature(path):
+        """ Return a hash of the names, sizes and modification times of the files of a
+        grid directory. """
+        content = hashlib.sha1()
+        for name in sorted(os.listdir(path)):
+            stat = os.stat(os.path.join(path, name))
+            content.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        return content.hexdigest()
+
+    def get_signature(self):
+        """ Return a hash identifying the grid content: the state of its files for loaded
+        grids, or a hash of its axes and potentials (computed chunk by chunk) otherwise. """
+        if self._signature is None:
+            content = hashlib.sha1()
+            for axis in self.axes:
+                content.update(axis.tobytes())
+            content.update(str(self.potential.dtype).encode())
+            for plane in self.potential:
+                content.update(np.ascontiguousarray(plane).tobytes())
+            self._signature = content.hexdigest()
+        return self._signature
+
+    def get_key(self):
+        return (self.__class__.__name__, self.path, self.get_signature(), float(self.scale))
+
+    def get_config(self):
+        return {'type': self.__class__.__name__, 'path': self.path, 'signature': self.get_signature(),
+                'scale': self.scale}
+
+
+def place_on_trajectory(points, s):
+    """ Return the (x, y, z) coordinates of positions along a fiber trajectory.
+
+    Keyword arguments:
+    points -- vertices of the trajectory polyline, as (x, y, z) coordinates in
+    micrometers
+    s -- curvilinear positions in micrometers, relative to the middle of the trajectory
+    (beyond its ends, positions extend along the first and last polyline edges)
+    """
+    points = np.asarray(points, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 3 or points.shape[0] < 2:
+        raise ValueError('a trajectory must be given as at least two (x, y, z) points')
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    if np.any(lengths == 0):
+        raise ValueError('trajectory points must be distinct')
+    arc = np.insert(np.cumsum(lengths), 0, 0.)
+    s = np.asarray(s, dtype=float) + arc[-1] / 2
+    i = np.clip(np.searchsorted(arc, s, side='right') - 1, 0, lengths.size - 1)
+    w = (s - arc[i]) / lengths[i]
+    return points[i] + w[..., None] * (points[i + 1] - points[i])
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+""" Surrogate model of activation thresholds.
+
+Thresholds are precomputed by titration over a rectilinear grid of fiber diameters,
+electrode-fiber distances and pulse widths, and queried by multilinear interpolation
+of their logarithm (over diameter, log-distance and log-pulse width), in which they
+vary smoothly. Grid nodes whose threshold could not be titrated (NaN) are left out of
+the interpolation.
+"""
+
+import json
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .titration import strength_duration_curve
+from .results import _to_builtin
+
+
+def _compute_thresholds(args):
+    diameter, distance, pulseWidths, kwargs = args
+    thresholds, _, _ = strength_duration_curve(diameter, pulseWidths, distance, **kwargs)
+    return thresholds
+
+
+class ThresholdTable:
+    """ Lookup table of activation thresholds over diameters, distances and pulse widths,
+    answering queries by interpolation together with an estimate of the interpolation
+    error, and adaptively refined where this error is high.
+    """
+
+    axisNames = ('diameter', 'distance', 'pulseWidth')
+
+    # Coordinates in which thresholds are interpolated, for each axis
+    _forward = (lambda x: x, np.log, np.log)
+    _inverse = (lambda x: x, np.exp, np.exp)
+
+    def __init__(self, diameters, distances, pulseWidths, thresholds=None, titrationKwargs=None):
+        """ Object initialization.
+
+        Keyword arguments:
+        diameters -- fiber diameters in micrometers
+        distances -- electrode-fiber distances in micrometers
+        pulseWidths -- pulse widths in ms
+        thresholds -- thresholds (in uA) at each grid node (default None, i.e. not computed)
+        titrationKwargs -- keyword arguments passed to find_threshold when computing
+        thresholds (default None)
+        """
+        self.axes = [np.unique(np.asarray(x, dtype=float)) for x in (diameters, distances, pulseWidths)]
+        for name, axis in zip(self.axisNames, self.axes):
+            if axis.size < 2:
+                raise ValueError(f'at least two {name} values are required')
+        shape = tuple(axis.size for axis in self.axes)
+        if thresholds is None:
+            thresholds = np.full(shape, np.nan)
+            self._computed = np.zeros(shape, dtype=bool)
+        else:
+            thresholds = np.asarray(thresholds, dtype=float)
+            if thresholds.shape != shape:
+                raise ValueError(f'thresholds shape {thresholds.shape} does not match grid shape {shape}')
+            self._computed = np.ones(shape, dtype=bool)
+        self.thresholds = thresholds
+        self.titrationKwargs = titrationKwargs or {}
+        self._cellErrors = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({" x ".join(str(axis.size) for axis in self.axes)})'
+
+    @classmethod
+    def compute(cls, diameters, distances, pulseWidths, tol=None, maxIterations=3, nprocs=None, **kwargs):
+        """ Compute a threshold table by titration, optionally refined adaptively.
+
+        Keyword arguments:
+        diameters -- fiber diameters in micrometers
+        distances -- electrode-fiber distances in micrometers
+        pulseWidths -- pulse widths in ms
+        tol -- relative interpolation error above which grid cells are refined (default
+        None, i.e. no refinement)
+        maxIterations -- maximal number of refinement iterations (default 3)
+        nprocs -- number of worker processes (default None, i.e. number of CPUs)
+        kwargs -- additional keyword arguments passed to find_threshold
+        """
+        table = cls(diameters, distances, pulseWidths, titrationKwargs=kwargs)
+        table.update(nprocs)
+        if tol is not None:
+            table.refine(tol, maxIterations, nprocs)
+        return table
+
+    def update(self, nprocs=None):
+        """ Compute the thresholds of all grid nodes not computed yet, titrating the
+        missing pulse widths of each (diameter, distance) pair in a pool of processes.
+
+        Keyword arguments:
+        nprocs -- number of worker processes (default None, i.e. number of CPUs)
+        """
+        lines = [(i, j) for i, j in itertools.product(*map(range, self.thresholds.shape[:2]))
+                 if not self._computed[i, j].all()]
+        if not lines:
+            return
+        jobs = [(self.axes[0][i], self.axes[1][j], self.axes[2][~self._computed[i, j]], self.titrationKwargs)
+                for i, j in lines]
+        print(f'computing {sum(job[2].size for job in jobs)} thresholds...')
+        with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+            for (i, j), thresholds in zip(lines, executor.map(_compute_thresholds, jobs)):
+                self.thresholds[i, j, ~self._computed[i, j]] = thresholds
+                self._computed[i, j] = True
+        self._cellErrors = None
+
+    def save(self, fpath):
+        """ Save the table in a .npz file, titration keyword arguments being serialized
+        as JSON. """
+        if not self._computed.all():
+            raise ValueError('cannot save a table with uncomputed thresholds')
+        np.savez(fpath, diameters=self.axes[0], distances=self.axes[1], pulseWidths=self.axes[2],
+                 thresholds=self.thresholds, titrationKwargs=json.dumps(self.titrationKwargs, default=_to_builtin))
+
+    @classmethod
+    def load(cls, fpath):
+        """ Load a table saved in a .npz file. """
+        with np.load(fpath) as data:
+            kwargs = json.loads(data['titrationKwargs'].item()) if 'titrationKwargs' in data.files else {}
+            return cls(data['diameters'], data['distances'], data['pulseWidths'], data['thresholds'], kwargs)
+
+    def _get_grid(self):
+        """ Return the grid axes in interpolation coordinates. """
+        return [f(axis) for f, axis in zip(self._forward, self.axes)]
+
+    def _get_axis_errors(self):
+        """ Estimate the interpolation error (on log-thresholds) of each grid interval
+        along each axis, from the second derivative of log-thresholds: linear
+        interpolation over an interval of width dx deviates by up to |f''| * dx^2 / 8.
+
+        Return one array per axis, of the grid shape reduced by one along that axis
+        (with infinite errors along axes of less than three values).
+        """
+        grid = self._get_grid()
+        logThresholds = np.log(np.abs(self.thresholds))
+        errors = []
+        for k, x in enumerate(grid):
+            if x.size < 3:
+                # Curvature cannot be estimated from two points only
+                shape = list(logThresholds.shape)
+                shape[k] -= 1
+                errors.append(np.full(shape, np.inf))
+                continue
+            dx = np.diff(x).reshape([-1 if i == k else 1 for i in range(len(grid))])
+            slopes = np.diff(logThresholds, axis=k) / dx
+            # Second divided differences at interior nodes, extended to boundary nodes
+            d2 = np.abs(2 * np.diff(slopes, axis=k) / (dx.take(range(x.size - 2), axis=k) +
+                                                       dx.take(range(1, x.size - 1), axis=k)))
+            d2 = np.concatenate((d2.take([0], axis=k), d2, d2.take([-1], axis=k)), axis=k)
+            d2 = np.maximum(d2.take(range(x.size - 1), axis=k), d2.take(range(1, x.size), axis=k))
+            errors.append(d2 * dx**2 / 8)
+        return errors
+
+    def get_cell_errors(self):
+        """ Return the estimated relative interpolation error of each grid cell (infinite
+        if it cannot be estimated, e.g. next to untitrated nodes). """
+        if self._cellErrors is not None:
+            return self._cellErrors
+        cellErrors = 0.
+        for k, errors in enumerate(self._get_axis_errors()):
+            # Reduce the other axes from nodes to intervals (maximum over cell corners)
+            for i in range(errors.ndim):
+                if i != k:
+                    n = errors.shape[i]
+                    errors = np.maximum(errors.take(range(n - 1), axis=i), errors.take(range(1, n), axis=i))
+            cellErrors = cellErrors + errors
+        cellErrors = np.expm1(cellErrors)
+        cellErrors[np.isnan(cellErrors)] = np.inf
+        self._cellErrors = cellErrors
+        return self._cellErrors
+
+    def refine(self, tol=0.02, maxIterations=3, nprocs=None):
+        """ Refine the grid where the estimated relative interpolation error exceeds a
+        tolerance, by inserting the midpoints of the offending intervals along each axis
+        and titrating the new grid nodes.
+
+        Keyword arguments:
+        tol -- relative interpolation error tolerance (default 0.02)
+        maxIterations -- maximal number of refinement iterations (default 3)
+        nprocs -- number of worker processes (default None, i.e. number of CPUs)
+        """
+        for _ in range(maxIterations):
+            grid = self._get_grid()
+            newAxes = []
+            for k, errors in enumerate(self._get_axis_errors()):
+                otherAxes = tuple(i for i in range(errors.ndim) if i != k)
+                flagged = np.nanmax(np.expm1(errors), axis=otherAxes) > tol
+                midpoints = self._inverse[k]((grid[k][:-1] + grid[k][1:])[flagged] / 2)
+                newAxes.append(np.union1d(self.axes[k], midpoints))
+            if all(new.size == axis.size for new, axis in zip(newAxes, self.axes)):
+                break
+            print(f'refining grid from {self} to {" x ".join(str(axis.size) for axis in newAxes)}')
+            self._regrid(newAxes)
+            self.update(nprocs)
+
+    def _regrid(self, newAxes):
+        """ Extend the grid with new axis values, keeping computed thresholds. """
+        thresholds = np.full(tuple(axis.size for axis in newAxes), np.nan)
+        computed = np.zeros(thresholds.shape, dtype=bool)
+        index = np.ix_(*[np.searchsorted(new, axis) for new, axis in zip(newAxes, self.axes)])
+        thresholds[index] = self.thresholds
+        computed[index] = self._computed
+        self.axes, self.thresholds, self._computed = newAxes, thresholds, computed
+        self._cellErrors = None
+
+    def __call__(self, diameter, distance, pulseWidth):
+        """ Interpolate thresholds at given diameters, distances and pulse widths.
+
+        Keyword arguments:
+        diameter -- fiber diameter(s) in micrometers
+        distance -- electrode-fiber distance(s) in micrometers
+        pulseWidth -- pulse width(s) in ms
+
+        Return the interpolated thresholds (in uA) and their estimated relative error,
+        as arrays of the broadcast shape of the inputs. Untitrated (NaN) cell corners are
+        left out by renormalizing the weights of the others, thresholds being NaN if all
+        corners with a non-zero weight are untitrated.
+        """
+        if not self._computed.all():
+            raise ValueError('table thresholds have not been computed')
+        points = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (diameter, distance, pulseWidth)])
+        shape = points[0].shape
+        indexes, weights = [], []
+        for name, f, axis, x in zip(self.axisNames, self._forward, self._get_grid(), points):
+            x = f(x.ravel())
+            if np.any((x < axis[0]) | (x > axis[-1])):
+                raise ValueError(f'{name} out of table range')
+            i = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, axis.size - 2)
+            indexes.append(i)
+            weights.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+
+        logThresholds = np.log(np.abs(self.thresholds))
+        result, totalWeight = 0., 0.
+        for corner in itertools.product((0, 1), repeat=3):
+            weight = np.prod([w if c else 1 - w for c, w in zip(corner, weights)], axis=0)
+            values = logThresholds[tuple(i + c for i, c in zip(indexes, corner))]
+            valid = ~np.isnan(values)
+            result = result + np.where(valid, weight * values, 0.)
+            totalWeight = totalWeight + np.where(valid, weight, 0.)
+        result = np.divide(result, totalWeight, out=np.full_like(result, np.nan), where=totalWeight > 0)
+        sign = np.sign(np.nanmean(self.thresholds))
+        thresholds = sign * np.exp(result)
+        errors = self.get_cell_errors()[tuple(indexes)]
+        return thresholds.reshape(shape), errors.reshape(shape)
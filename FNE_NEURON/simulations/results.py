@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+""" On-disk storage of simulation results.
+
+Each run is stored in its own directory, containing a meta.json file with the run
+parameters and one .npy file per array (time vector, voltage traces, stimulus trace,
+spike times...). Arrays are written chunk by chunk through memory maps, and read back
+lazily as read-only memory maps, so that analyses can open many runs without loading
+their traces.
+"""
+
+import os
+import json
+
+import numpy as np
+
+
+def _to_builtin(value):
+    """ Convert NumPy scalars and arrays into JSON serializable objects. """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
+
+def write_results(path, meta, arrays, chunkSize=1 << 20):
+    """ Write the results of a run into a directory.
+
+    Keyword arguments:
+    path -- path of the run directory (created if needed)
+    meta -- dictionary of run parameters and metadata
+    arrays -- dictionary of NumPy arrays
+    chunkSize -- maximal number of elements written at once (default 2^20)
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        out = np.lib.format.open_memmap(
+            os.path.join(path, f'{key}.npy'), mode='w+', dtype=array.dtype, shape=array.shape)
+        if array.ndim == 0:
+            out[...] = array
+        else:
+            rowSize = max(int(np.prod(array.shape[1:])), 1)
+            step = max(chunkSize // rowSize, 1)
+            for i in range(0, array.shape[0], step):
+                out[i:i + step] = array[i:i + step]
+        out.flush()
+        del out
+    meta = dict(meta, arrays=sorted(arrays.keys()))
+    with open(os.path.join(path, 'meta.json'), 'w') as fh:
+        json.dump(meta, fh, indent=2, default=_to_builtin)
+    return path
+
+
+class Results:
+    """ Lazy reader of the results of a run stored by write_results.
+
+    Metadata are read upon opening, whereas arrays are only memory-mapped when accessed.
+    """
+
+    def __init__(self, path):
+        """ Object initialization.
+
+        Keyword arguments:
+        path -- path of the run directory
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as fh:
+            self.meta = json.load(fh)
+        self._arrays = {}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path})'
+
+    def keys(self):
+        """ Return the names of the stored arrays. """
+        return self.meta['arrays']
+
+    def __contains__(self, key):
+        return key in self.meta['arrays']
+
+    def __getitem__(self, key):
+        """ Return a stored array as a read-only memory map. """
+        if key not in self:
+            raise KeyError(f'no "{key}" array in {self.path}')
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.path, f'{key}.npy'), mmap_mode='r')
+        return self._arrays[key]
+
+
+def load_results(path):
+    """ Open the results of a run stored in a directory. """
+    return Results(path)
+
+
+def list_results(folder):
+    """ Open the results of all runs stored in the subdirectories of a folder. """
+    return [Results(os.path.join(folder, name)) for name in sorted(os.listdir(folder))
+            if os.path.isfile(os.path.join(folder, name, 'meta.json'))]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+from neuron import h
+import numpy as np
+
+from .MyelinatedFiberStimulation import MyelinatedFiberStimulation
+from .activation import predict_threshold
+
+
+def simulate_stimulation(diameter, amplitude, pulseWidth, frequency, tstop=10., distance=100., screenMargin=None):
+    """ Simulate the extracellular stimulation of a myelinated fiber and return a
+    compact summary of its response.
+
+    Keyword arguments:
+    diameter -- fiber diameter in micrometers
+    amplitude -- stimulation amplitude in uA
+    pulseWidth -- pulse width in ms
+    frequency -- stimulation frequency in Hz (0 for a single pulse)
+    tstop -- simulation duration in ms (default 10)
+    distance -- electrode-fiber distance in micrometers (default 100)
+    screenMargin -- if set, stimuli weaker than the predicted single pulse threshold
+    divided by this margin are considered sub-threshold without being simulated
+    (default None)
+
+    Return a dictionary with the activation flag, the latency (in ms, NaN if not
+    activated) and the number of spikes reaching the end of the fiber.
+    """
+    simulation = MyelinatedFiberStimulation(
+        diameter, amplitude, frequency, tstop, pulseWidth, reuseFiber=True)
+    simulation.fibersPosition = distance
+    if screenMargin is not None:
+        threshold = predict_threshold(simulation.fiber, distance, pulseWidth, polarity=np.sign(amplitude) or -1)
+        if np.abs(amplitude) * screenMargin < np.abs(threshold):
+            return {'activated': False, 'latency': np.nan, 'nspikes': 0}
+    # Trains are simulated until the end to count all propagated spikes
+    simulation.set_spike_detection(earlyExit=frequency == 0)
+    simulation.run()
+    spikes = simulation.spikeTimes[simulation.fiber.nNodes - 1]
+    return {
+        'activated': spikes.size > 0,
+        'latency': spikes[0] - simulation._stimStartTime if spikes.size > 0 else np.nan,
+        'nspikes': spikes.size
+    }
+
+
+def _simulate_job(i, kwargs):
+    return int(i), simulate_stimulation(**kwargs)
+
+
+def _simulate_local_job(args):
+    return _simulate_job(*args)
+
+
+def run_sweep(diameters, amplitudes, pulseWidths, frequencies=(0,), nprocs=None, backend='auto', **kwargs):
+    """ Run stimulation simulations over a parameter grid, distributed over MPI ranks
+    with NEURON's bulletin board if the script was launched with MPI (e.g. mpiexec -n 8
+    python script.py), or over a local pool of processes otherwise.
+
+    With MPI, worker ranks execute simulations until the sweep is completed and then
+    exit, while the master rank (rank 0) gathers and returns the results.
+
+    Keyword arguments:
+    diameters -- fiber diameters in micrometers
+    amplitudes -- stimulation amplitudes in uA
+    pulseWidths -- pulse widths in ms
+    frequencies -- stimulation frequencies in Hz (default (0,), i.e. single pulses)
+    nprocs -- number of local worker processes (default None, i.e. number of CPUs)
+    backend -- 'mpi', 'pool' or 'auto' to use MPI whenever several ranks are available
+    (default 'auto')
+    kwargs -- additional keyword arguments passed to simulate_stimulation
+
+    Return a DataFrame with one row per parameter combination.
+    """
+    import pandas as pd
+
+    combinations = list(itertools.product(diameters, amplitudes, pulseWidths, frequencies))
+    jobs = [dict(diameter=d, amplitude=a, pulseWidth=pw, frequency=f, **kwargs)
+            for d, a, pw, f in combinations]
+
+    h.nrnmpi_init()
+    pc = h.ParallelContext()
+    if backend == 'auto':
+        backend = 'mpi' if pc.nhost() > 1 else 'pool'
+
+    results = [None] * len(jobs)
+    if backend == 'mpi':
+        # Bulletin board: workers run submitted jobs, the master gathers their results
+        pc.runworker()
+        for i, job in enumerate(jobs):
+            pc.submit(_simulate_job, i, job)
+        while pc.working():
+            i, result = pc.pyret()
+            results[i] = result
+        pc.done()
+    elif backend == 'pool':
+        with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+            for i, result in executor.map(_simulate_local_job, enumerate(jobs)):
+                results[i] = result
+    else:
+        raise ValueError(f'unknown sweep backend: "{backend}"')
+
+    table = pd.DataFrame(combinations, columns=['diameter', 'amplitude', 'pulseWidth', 'frequency'])
+    return pd.concat([table, pd.DataFrame(results)], axis=1)
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .MyelinatedFiberStimulation import MyelinatedFiberStimulation
+from . import activation
+from .activation import predict_threshold, get_truncated_node_count
+from ..cells import MyelinatedFiber
+
+
+def find_threshold(diameter, pulseWidth, distance=100., polarity=-1, tstop=5.,
+                   amplitude=None, minAmplitude=1e-3, maxAmplitude=1e4, rtol=0.01, latencyMargin=1., bracketFactor=None,
+                   nNodes=101, nseg=1):
+    """ Find the activation threshold of a myelinated fiber for a single
+    extracellular pulse, by bracketed bisection on the stimulation amplitude.
+
+    A fiber is considered activated when an action potential reaches its end node.
+    Simulations run in spike detection mode and stop as soon as the outcome is known.
+
+    Keyword arguments:
+    diameter -- fiber diameter in micrometers
+    pulseWidth -- pulse width in ms
+    distance -- electrode-fiber distance in micrometers (default 100)
+    polarity -- pulse polarity: -1 for cathodic, 1 for anodic (default -1)
+    tstop -- simulation duration in ms (default 5)
+    amplitude -- initial guess of the threshold magnitude in uA (default None, i.e.
+    predicted from the passive response of the fiber to the stimulus)
+    minAmplitude -- minimal amplitude magnitude tested in uA (default 1e-3)
+    maxAmplitude -- maximal amplitude magnitude tested in uA (default 1e4)
+    rtol -- relative tolerance on the threshold (default 0.01)
+    latencyMargin -- delay (in ms) after pulse offset within which a spike must be
+    initiated (default 1)
+    bracketFactor -- factor by which the amplitude is scaled while bracketing the
+    threshold, to be decreased if the initial guess is accurate (default None, i.e. 1.2
+    for predicted cathodic thresholds and 2 otherwise)
+    nNodes -- number of nodes of the fiber, or 'auto' to truncate it to the region where
+    the activating function of the electrode is not negligible (default 101)
+    nseg -- number of segments per section (see MyelinatedFiber, default 1)
+
+    Return the threshold amplitude (in uA, signed according to polarity), or NaN
+    if the threshold cannot be bracketed, i.e. if the fiber is not activated at
+    maxAmplitude, or is still activated at minAmplitude (e.g. spontaneous firing).
+    """
+    if not 0 < minAmplitude < maxAmplitude:
+        raise ValueError('amplitude bounds must satisfy 0 < minAmplitude < maxAmplitude')
+    if amplitude is not None and not amplitude > 0:
+        raise ValueError('the initial amplitude guess must be a positive magnitude')
+    if bracketFactor is not None and not bracketFactor > 1:
+        raise ValueError('the bracketing factor must be greater than 1')
+    if nNodes == 'auto':
+        nNodes = get_truncated_node_count(diameter, distance, nseg=nseg)
+    simulation = MyelinatedFiberStimulation(diameter, 0, 0, tstop, pulseWidth, reuseFiber=True,
+                                            nNodes=nNodes, nseg=nseg)
+    simulation.fibersPosition = distance
+    simulation.set_spike_detection(latencyMargin=latencyMargin)
+    if amplitude is None:
+        amplitude = abs(predict_threshold(simulation.fiber, distance, pulseWidth, polarity=polarity))
+        if not amplitude > 0:  # undefined prediction
+            amplitude = maxAmplitude
+        if bracketFactor is None and polarity < 0:
+            bracketFactor = 1.2
+    if bracketFactor is None:
+        bracketFactor = 2.
+
+    def is_activated(amplitude):
+        simulation.set_amplitude(polarity * amplitude)
+        simulation.run()
+        return simulation.propagated
+
+    # Bracket the threshold
+    amplitude = min(max(amplitude, minAmplitude), maxAmplitude)
+    if is_activated(amplitude):
+        lo, hi = max(amplitude / bracketFactor, minAmplitude), amplitude
+        while is_activated(lo):
+            if lo <= minAmplitude:
+                return np.nan
+            lo, hi = max(lo / bracketFactor, minAmplitude), lo
+    else:
+        lo, hi = amplitude, min(bracketFactor * amplitude, maxAmplitude)
+        while not is_activated(hi):
+            if hi >= maxAmplitude:
+                return np.nan
+            lo, hi = hi, min(bracketFactor * hi, maxAmplitude)
+
+    # Refine it by bisection
+    while hi - lo > rtol * hi:
+        mid = (lo + hi) / 2
+        if is_activated(mid):
+            hi = mid
+        else:
+            lo = mid
+
+    return polarity * hi
+
+
+def _find_threshold(kwargs):
+    return find_threshold(**kwargs)
+
+
+def find_thresholds(diameters, pulseWidths, distances=(100.,), nprocs=None, **kwargs):
+    """ Find activation thresholds for all combinations of fiber diameters, pulse
+    widths and electrode-fiber distances, distributing titrations across a pool of
+    processes (each owning its own NEURON instance).
+
+    Keyword arguments:
+    diameters -- fiber diameters in micrometers
+    pulseWidths -- pulse widths in ms
+    distances -- electrode-fiber distances in micrometers (default (100,))
+    nprocs -- number of worker processes (default None, i.e. number of CPUs)
+    kwargs -- additional keyword arguments passed to find_threshold
+
+    Return a DataFrame with one row per combination and columns diameter, pulseWidth,
+    distance and threshold.
+    """
+    import pandas as pd
+
+    combinations = list(itertools.product(diameters, pulseWidths, distances))
+    jobs = [dict(diameter=d, pulseWidth=pw, distance=r, **kwargs) for d, pw, r in combinations]
+    with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+        thresholds = list(executor.map(_find_threshold, jobs))
+    table = pd.DataFrame(combinations, columns=['diameter', 'pulseWidth', 'distance'])
+    table['threshold'] = thresholds
+    return table
+
+
+def fit_strength_duration(pulseWidths, thresholds):
+    """ Fit Weiss' law to a strength-duration curve, i.e. a linear relationship between
+    the threshold charge Q = I * PW and the pulse width: Q = Irh * (PW + chronaxie).
+
+    Keyword arguments:
+    pulseWidths -- pulse widths in ms
+    thresholds -- threshold amplitudes in uA (NaN values are ignored)
+
+    Return the rheobase (in uA, signed as the thresholds) and the chronaxie (in ms).
+    """
+    pulseWidths = np.asarray(pulseWidths, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    valid = ~np.isnan(thresholds)
+    if valid.sum() < 2:
+        return np.nan, np.nan
+    pulseWidths, thresholds = pulseWidths[valid], thresholds[valid]
+    rheobase, intercept = np.polyfit(pulseWidths, np.abs(thresholds) * pulseWidths, 1)
+    return np.sign(thresholds[0]) * rheobase, intercept / rheobase
+
+
+def strength_duration_curve(diameter, pulseWidths, distance=100., amplitude=None, bracketFactor=1.1, **kwargs):
+    """ Compute the strength-duration curve of a myelinated fiber, i.e. its activation
+    threshold for a range of pulse widths.
+
+    Pulse widths are titrated in increasing order on the same fiber, each titration
+    being warm-started from the threshold predicted by Weiss' law fitted to the
+    previous points (or scaled from the previous threshold with a typical chronaxie),
+    with a narrow initial bracket.
+
+    Keyword arguments:
+    diameter -- fiber diameter in micrometers
+    pulseWidths -- pulse widths in ms
+    distance -- electrode-fiber distance in micrometers (default 100)
+    amplitude -- initial guess of the first threshold magnitude in uA (default None,
+    i.e. predicted from the passive response of the fiber)
+    bracketFactor -- bracketing factor of warm-started titrations (default 1.1)
+    kwargs -- additional keyword arguments passed to find_threshold
+
+    Return the thresholds (in uA), the rheobase (in uA) and the chronaxie (in ms).
+    """
+    pulseWidths = np.asarray(pulseWidths, dtype=float)
+    thresholds = np.full(pulseWidths.size, np.nan)
+    titrated = []
+    for i in np.argsort(pulseWidths):
+        known = [j for j in titrated if not np.isnan(thresholds[j])]
+        if len(known) >= 2:
+            rheobase, chronaxie = fit_strength_duration(pulseWidths[known], thresholds[known])
+            guess = np.abs(rheobase) * (1 + chronaxie / pulseWidths[i])
+        elif len(known) == 1:
+            j = known[0]
+            guess = np.abs(thresholds[j]) * (1 + activation.chronaxie / pulseWidths[i]) / \
+                (1 + activation.chronaxie / pulseWidths[j])
+        else:
+            guess = None
+        if guess is not None and guess > 0:
+            thresholds[i] = find_threshold(diameter, pulseWidths[i], distance, amplitude=guess,
+                                           bracketFactor=bracketFactor, **kwargs)
+        else:
+            thresholds[i] = find_threshold(diameter, pulseWidths[i], distance, amplitude=amplitude, **kwargs)
+        titrated.append(i)
+    return (thresholds, *fit_strength_duration(pulseWidths, thresholds))
+
+
+def _strength_duration_curve(args):
+    diameter, pulseWidths, distance, kwargs = args
+    return strength_duration_curve(diameter, pulseWidths, distance, **kwargs)
+
+
+def strength_duration_curves(diameters, pulseWidths, distances=(100.,), nprocs=None, **kwargs):
+    """ Compute strength-duration curves for all combinations of fiber diameters and
+    electrode-fiber distances, distributing curves across a pool of processes.
+
+    Keyword arguments:
+    diameters -- fiber diameters in micrometers
+    pulseWidths -- pulse widths in ms
+    distances -- electrode-fiber distances in micrometers (default (100,))
+    nprocs -- number of worker processes (default None, i.e. number of CPUs)
+    kwargs -- additional keyword arguments passed to strength_duration_curve
+
+    Return a DataFrame of thresholds with columns diameter, pulseWidth, distance and
+    threshold, and a DataFrame of fitted parameters with columns diameter, distance,
+    rheobase and chronaxie.
+    """
+    import pandas as pd
+
+    combinations = list(itertools.product(diameters, distances))
+    jobs = [(d, pulseWidths, r, kwargs) for d, r in combinations]
+    with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+        curves = list(executor.map(_strength_duration_curve, jobs))
+    table = pd.DataFrame(
+        [(d, pw, r, threshold) for (d, r), (thresholds, _, _) in zip(combinations, curves)
+         for pw, threshold in zip(pulseWidths, thresholds)],
+        columns=['diameter', 'pulseWidth', 'distance', 'threshold'])
+    fits = pd.DataFrame(
+        [(d, r, rheobase, chronaxie) for (d, r), (_, rheobase, chronaxie) in zip(combinations, curves)],
+        columns=['diameter', 'distance', 'rheobase', 'chronaxie'])
+    return table, fits
+
+
+def _time_threshold(kwargs):
+    start = time.time()
+    threshold = find_threshold(**kwargs)
+    return threshold, time.time() - start
+
+
+def discretization_convergence(diameter, pulseWidth, distance=100., nNodes=(11, 21, 41, 'auto', 101),
+                               nseg=(1, 3), target=0.01, nprocs=None, **kwargs):
+    """ Assess the convergence of the activation threshold of a fiber with its length
+    and spatial discretization, in order to select the cheapest discretization meeting
+    an accuracy target.
+
+    Thresholds are titrated for all combinations of node counts and numbers of
+    segments per section, and compared with the threshold of the finest discretization
+    (largest number of compartments).
+
+    Keyword arguments:
+    diameter -- fiber diameter in micrometers
+    pulseWidth -- pulse width in ms
+    distance -- electrode-fiber distance in micrometers (default 100)
+    nNodes -- numbers of nodes, 'auto' denoting the truncation of find_threshold
+    (default (11, 21, 41, 'auto', 101))
+    nseg -- numbers of segments per section, as integers or dictionaries keyed by
+    section type (default (1, 3))
+    target -- maximal relative threshold error of the selected discretization (default
+    0.01)
+    nprocs -- number of worker processes (default None, i.e. number of CPUs)
+    kwargs -- additional keyword arguments passed to find_threshold (the titration
+    tolerance rtol defaulting to 0.001, well below the target)
+
+    Return a DataFrame with one row per discretization, sorted by number of compartments,
+    with columns nNodes, nseg, nCompartments, threshold, error (relative deviation from the
+    reference threshold) and time (titration wall time in s), and the row of the
+    cheapest discretization meeting the target (None if there is none).
+    """
+    import pandas as pd
+
+    kwargs.setdefault('rtol', 1e-3)
+    combinations = []
+    for n, segments in itertools.product(nNodes, nseg):
+        if n == 'auto':
+            n = get_truncated_node_count(diameter, distance, nseg=segments)
+        if all(n != m or segments != other for m, other, _ in combinations):
+            combinations.append((n, segments, MyelinatedFiber.compartments(diameter, n, segments)['x'].size))
+    jobs = [dict(diameter=diameter, pulseWidth=pulseWidth, distance=distance, nNodes=n, nseg=segments, **kwargs)
+            for n, segments, _ in combinations]
+    with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+        outcomes = list(executor.map(_time_threshold, jobs))
+    table = pd.DataFrame([(n, segments, size, threshold, duration)
+                          for (n, segments, size), (threshold, duration) in zip(combinations, outcomes)],
+                         columns=['nNodes', 'nseg', 'nCompartments', 'threshold', 'time'])
+    table = table.sort_values('nCompartments', kind='stable').reset_index(drop=True)
+    reference = table['threshold'].iloc[-1]
+    table['error'] = np.abs(table['threshold'] / reference - 1)
+    table = table[['nNodes', 'nseg', 'nCompartments', 'threshold', 'error', 'time']]
+    valid = table[table['error'] <= target]
+    return table, (valid.iloc[0] if len(valid) > 0 else None)
+
+
+def _find_threshold_sequence(args):
+    """ Find the thresholds of a sequence of similar fibers, warm-starting each
+    titration from the previous threshold. """
+    diameters, distances, pulseWidth, kwargs = args
+    kwargs = dict(kwargs)
+    amplitude = kwargs.pop('amplitude', None)
+    bracketFactor = kwargs.pop('bracketFactor', 1.1)
+    thresholds = []
+    guess = None
+    for diameter, distance in zip(diameters, distances):
+        if guess is None:
+            threshold = find_threshold(diameter, pulseWidth, distance, amplitude=amplitude, **kwargs)
+        else:
+            threshold = find_threshold(diameter, pulseWidth, distance, amplitude=guess,
+                                       bracketFactor=bracketFactor, **kwargs)
+        if not np.isnan(threshold):
+            guess = np.abs(threshold)
+        thresholds.append(threshold)
+    return thresholds
+
+
+def recruitment_curve(diameters, distances, amplitudes, pulseWidth=0.1, nprocs=None, **kwargs):
+    """ Compute the recruitment curve of a fiber population, i.e. the fraction of
+    fibers activated by a single pulse as a function of its amplitude.
+
+    Since activation is monotonic in amplitude, the curve is derived from the
+    threshold of each fiber rather than by simulating every amplitude. Fibers are
+    sorted by distance and diameter and split into contiguous chunks titrated in a
+    pool of processes, each titration being warm-started from the threshold of the
+    previous (similar) fiber of the chunk.
+
+    Keyword arguments:
+    diameters -- fiber diameters in micrometers
+    distances -- electrode-fiber distances in micrometers
+    amplitudes -- stimulation amplitudes in uA
+    pulseWidth -- pulse width in ms (default 0.1)
+    nprocs -- number of worker processes (default None, i.e. number of CPUs)
+    kwargs -- additional keyword arguments passed to find_threshold
+
+    Return the fraction of activated fibers at each amplitude, and the threshold of
+    each fiber (in uA, NaN if it cannot be activated).
+    """
+    diameters = np.asarray(diameters, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+    amplitudes = np.asarray(amplitudes, dtype=float)
+    order = np.lexsort((diameters, distances))
+    nchunks = min(order.size, 4 * (nprocs or os.cpu_count()))
+    chunks = np.array_split(order, nchunks)
+    jobs = [(diameters[chunk], distances[chunk], pulseWidth, kwargs) for chunk in chunks]
+    thresholds = np.full(order.size, np.nan)
+    with ProcessPoolExecutor(max_workers=nprocs, mp_context=mp.get_context('spawn')) as executor:
+        for chunk, chunkThresholds in zip(chunks, executor.map(_find_threshold_sequence, jobs)):
+            thresholds[chunk] = chunkThresholds
+    # Fibers that cannot be activated are never recruited (NaN comparisons are False)
+    with np.errstate(invalid='ignore'):
+        fractions = (np.abs(thresholds)[None, :] <= np.abs(amplitudes)[:, None]).mean(axis=1)
+    return fractions, thresholds
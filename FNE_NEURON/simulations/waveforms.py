@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+""" Stimulus waveforms.
+
+Waveforms are represented as piecewise-constant time courses, i.e. as a pair of
+breakpoint vectors (t, amp) in which amp[i] is the stimulus amplitude applied from
+t[i] until t[i + 1] (or until the end of the simulation for the last breakpoint).
+The first breakpoint is always at t = 0.
+"""
+
+import numpy as np
+
+
+def arbitrary_waveform(t, amp):
+    """ Return the breakpoints of an arbitrary piecewise-constant waveform.
+
+    Keyword arguments:
+    t -- breakpoint times in ms (must be non-decreasing)
+    amp -- amplitudes (in uA) applied from each breakpoint onwards
+    """
+    t = np.asarray(t, dtype=float)
+    amp = np.asarray(amp, dtype=float)
+    if t.ndim != 1 or t.shape != amp.shape:
+        raise ValueError('time and amplitude vectors must be 1D and of identical size')
+    if np.any(np.diff(t) < 0):
+        raise ValueError('time vector must be non-decreasing')
+    if t.size == 0 or t[0] > 0:
+        t = np.insert(t, 0, 0.)
+        amp = np.insert(amp, 0, 0.)
+    # Remove zero-duration steps, keeping the last value assigned at each time
+    keep = np.append(np.diff(t) > 0, True)
+    return t[keep], amp[keep]
+
+
+def pulse_train(phases, frequency, tstart, tstop):
+    """ Return the breakpoints of a train of pulses with an arbitrary phase sequence.
+
+    Keyword arguments:
+    phases -- list of (duration (ms), amplitude (uA)) tuples defining a single pulse
+    frequency -- pulse repetition frequency in Hz (0 for a single pulse)
+    tstart -- onset of the first pulse in ms
+    tstop -- end of the stimulation window in ms
+    """
+    durations, amps = np.array(phases, dtype=float).T
+    pulseDuration = durations.sum()
+    if frequency > 0:
+        interval = 1000. / frequency  # in ms
+        if interval < pulseDuration:
+            raise ValueError(f'pulse duration ({pulseDuration} ms) exceeds stimulation interval ({interval} ms)')
+        onsets = np.arange(tstart, tstop, interval)
+    else:
+        onsets = np.array([tstart]) if tstart < tstop else np.array([])
+
+    # Breakpoints of a single pulse: onset of each phase, then return to zero
+    tpulse = np.append(0., np.cumsum(durations))
+    apulse = np.append(amps, 0.)
+    t = (onsets[:, None] + tpulse[None, :]).ravel()
+    amp = np.tile(apulse, onsets.size)
+    return arbitrary_waveform(t, amp)
+
+
+def monophasic_pulse_train(amplitude, pulseWidth, frequency, tstart, tstop):
+    """ Return the breakpoints of a monophasic rectangular pulse train.
+
+    Keyword arguments:
+    amplitude -- pulse amplitude in uA
+    pulseWidth -- pulse width in ms
+    frequency -- pulse repetition frequency in Hz (0 for a single pulse)
+    tstart -- onset of the first pulse in ms
+    tstop -- end of the stimulation window in ms
+    """
+    return pulse_train([(pulseWidth, amplitude)], frequency, tstart, tstop)
+
+
+def biphasic_pulse_train(amplitude, pulseWidth, frequency, tstart, tstop, interPhaseGap=0.):
+    """ Return the breakpoints of a symmetric biphasic rectangular pulse train.
+
+    Keyword arguments:
+    amplitude -- amplitude of the leading phase in uA
+    pulseWidth -- width of each phase in ms
+    frequency -- pulse repetition frequency in Hz (0 for a single pulse)
+    tstart -- onset of the first pulse in ms
+    tstop -- end of the stimulation window in ms
+    interPhaseGap -- delay between the two phases in ms (default 0)
+    """
+    phases = [(pulseWidth, amplitude), (interPhaseGap, 0.), (pulseWidth, -amplitude)]
+    return pulse_train(phases, frequency, tstart, tstop)
+
+
+def charge_balanced_pulse_train(amplitude, pulseWidth, frequency, tstart, tstop,
+                                ratio=5., interPhaseGap=0.):
+    """ Return the breakpoints of an asymmetric charge-balanced pulse train, in which
+    each leading pulse is followed by a longer, weaker phase of opposite polarity
+    injecting the same charge.
+
+    Keyword arguments:
+    amplitude -- amplitude of the leading phase in uA
+    pulseWidth -- width of the leading phase in ms
+    frequency -- pulse repetition frequency in Hz (0 for a single pulse)
+    tstart -- onset of the first pulse in ms
+    tstop -- end of the stimulation window in ms
+    ratio -- duration ratio between the balancing and leading phases (default 5)
+    interPhaseGap -- delay between the two phases in ms (default 0)
+    """
+    phases = [(pulseWidth, amplitude), (interPhaseGap, 0.), (pulseWidth * ratio, -amplitude / ratio)]
+    return pulse_train(phases, frequency, tstart, tstop)
+
+
+def waveform_trace(t, amp, tstop):
+    """ Return the [time, amplitude] step trace of a waveform over [0, tstop], with
+    duplicated points at each transition (suitable for plotting).
+
+    Keyword arguments:
+    t -- breakpoint times in ms
+    amp -- amplitudes (in uA) applied from each breakpoint onwards
+    tstop -- end of the trace in ms
+    """
+    inside = t < tstop
+    t, amp = t[inside], amp[inside]
+    tsteps = np.append(np.repeat(t, 2)[1:], tstop)
+    asteps = np.repeat(amp, 2)
+    return np.column_stack((tsteps, asteps))
@@ -1,5 +1,6 @@
 import platform
 import os
+import hashlib
 from neuron import h
 from neuron import load_mechanisms as load_mechanisms_native
 
@@ -13,6 +14,49 @@ def getNmodlDir():
     return os.path.join(selfdir, 'nmodl')
 
 
+def get_mechanisms_library(path):
+    ''' Return the platform-dependent path to the compiled library of the mechanisms
+        of a directory.
+
+        :param path: full path to directory containing the MOD files of the mechanisms.
+    '''
+    OS = platform.system()
+    if OS == 'Windows':
+        lib_path = os.path.join(path, 'nrnmech.dll')
+    elif OS == 'Linux':
+        lib_path = os.path.join(path, platform.machine(), '.libs', 'libnrnmech.so')
+    elif OS == 'Darwin':
+        lib_path = os.path.join(path, platform.machine(), '.libs', 'libnrnmech.dylib')
+    else:
+        raise OSError('Mechanisms loading on "{}" currently not handled.'.format(OS))
+    if not os.path.isfile(lib_path):
+        raise RuntimeError('Compiled library file not found for mechanisms in "{}"'.format(path))
+    return lib_path
+
+
+mechanisms_signatures = {}
+
+
+def get_mechanisms_signature(path):
+    ''' Return a signature identifying the compiled library of the mechanisms of a
+        directory, i.e. its path, modification time and SHA-256 hash, which changes
+        whenever the mechanisms are recompiled.
+
+        :param path: full path to directory containing the MOD files of the mechanisms.
+    '''
+    lib_path = os.path.realpath(get_mechanisms_library(path))
+    stat = os.stat(lib_path)
+    key = (lib_path, stat.st_mtime, stat.st_size)
+    if key not in mechanisms_signatures:
+        sha = hashlib.sha256()
+        with open(lib_path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                sha.update(chunk)
+        mechanisms_signatures[key] = {
+            'path': lib_path, 'mtime': stat.st_mtime, 'sha256': sha.hexdigest()}
+    return mechanisms_signatures[key]
+
+
 def load_mechanisms(path, mechname=None):
     ''' Rewrite of NEURON's native load_mechanisms method to ensure Windows and Linux compatibility.
 
@@ -21,22 +65,12 @@ def load_mechanisms(path, mechname=None):
         in source file.
     '''
 
-    # Get OS
-    OS = platform.system()
-
     # If Darwin, call native NEURON function and return
-    if OS == 'Darwin':
+    if platform.system() == 'Darwin':
         return load_mechanisms_native(path)
 
     # Otherwise, get platform-dependent path to compiled library file
-    if OS == 'Windows':
-        lib_path = os.path.join(path, 'nrnmech.dll')
-    elif OS == 'Linux':
-        lib_path = os.path.join(path, platform.machine(), '.libs', 'libnrnmech.so')
-    else:
-        raise OSError('Mechanisms loading on "{}" currently not handled.'.format(platform.system()))
-    if not os.path.isfile(lib_path):
-        raise RuntimeError('Compiled library file not found for mechanisms in "{}"'.format(path))
+    lib_path = get_mechanisms_library(path)
 
     # If mechanisms of input path are already loaded, return silently
     global nrn_dll_loaded
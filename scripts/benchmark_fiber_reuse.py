@@ -0,0 +1,42 @@
+import sys
+
+import numpy as np
+
+from FNE_NEURON.simulations import MyelinatedFiberStimulation
+
+
+def main():
+    """ Script comparing the construction and integration times of an amplitude sweep,
+    with fibers rebuilt for every simulation or reused from the fiber pool.
+    """
+
+    fiberDiameter = 10  # um
+    pulseWidth = 0.1  # ms
+    stimulationFrequency = 0  # Hz
+    tstop = 3  # ms
+    if len(sys.argv) > 1:
+        nAmplitudes = int(sys.argv[1])
+    else:
+        nAmplitudes = 10
+    amplitudes = np.linspace(-10, -100, nAmplitudes)  # uA
+
+    times = {}
+    for reuseFiber in [False, True]:
+        constructionTimes, simulationTimes = [], []
+        for amplitude in amplitudes:
+            simulation = MyelinatedFiberStimulation(
+                fiberDiameter, amplitude, stimulationFrequency, tstop, pulseWidth, reuseFiber=reuseFiber)
+            simulation.set_spike_detection()
+            simulation.run()
+            constructionTimes.append(simulation.constructionTime)
+            simulationTimes.append(simulation.simulationTime)
+        times[reuseFiber] = (sum(constructionTimes), sum(simulationTimes))
+
+    print("\nTime breakdown over %d simulations:" % (nAmplitudes))
+    for reuseFiber, (constructionTime, simulationTime) in times.items():
+        print("\t%s: construction %.3f s, integration %.3f s" % (
+            "fiber pool" if reuseFiber else "rebuilt fibers", constructionTime, simulationTime))
+
+
+if __name__ == '__main__':
+    main()
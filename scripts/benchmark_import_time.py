@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import subprocess
+
+import numpy as np
+
+
+# Modules that must only be loaded on first use (plotting, reporting and solvers)
+lazyModules = ['matplotlib', 'pandas', 'scipy']
+
+# Code run by each fresh interpreter: time the imports of neuron and of the package,
+# and report the lazy modules loaded
+probe = '''
+import sys, json, time
+start = time.perf_counter()
+import neuron
+tneuron = time.perf_counter() - start
+import FNE_NEURON
+ttotal = time.perf_counter() - start
+print(json.dumps({'neuron': tneuron, 'total': ttotal,
+                  'loaded': [m for m in %r if m in sys.modules]}))
+''' % lazyModules
+
+
+def main():
+    """ Script measuring the time needed to import the package in fresh interpreters, as
+    paid by each process-pool or MPI worker, and checking that plotting, reporting and
+    solver dependencies are not loaded at import time.
+
+    The script exits with an error if any lazy module is loaded at import time, or if
+    the import time of the package (on top of that of neuron) exceeds a budget.
+    """
+
+    if len(sys.argv) > 1:
+        budget = float(sys.argv[1])  # s
+    else:
+        budget = 0.5  # s
+    nRuns = 5
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    outcomes = []
+    for _ in range(nRuns):
+        output = subprocess.run([sys.executable, '-c', probe], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        outcomes.append(json.loads(output.strip().splitlines()[-1]))
+
+    tneuron = np.median([x['neuron'] for x in outcomes])
+    ttotal = np.median([x['total'] for x in outcomes])
+    loaded = sorted(set(m for x in outcomes for m in x['loaded']))
+    print("\nImport time (median of %d fresh interpreters):" % nRuns)
+    print("\tneuron: %.3f s" % tneuron)
+    print("\tFNE_NEURON: %.3f s (%.3f s on top of neuron)" % (ttotal, ttotal - tneuron))
+    print("\tlazy modules loaded at import: %s" % (", ".join(loaded) if loaded else "none"))
+
+    failed = False
+    if loaded:
+        print("FAILED: %s must only be imported on first use" % ", ".join(loaded))
+        failed = True
+    if ttotal - tneuron > budget:
+        print("FAILED: package import exceeds the %.2f s budget" % budget)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import sys
+
+import numpy as np
+
+from FNE_NEURON.cells import set_rate_tables
+from FNE_NEURON.simulations import MyelinatedFiberStimulation
+
+
+def crossing_times(t, v, threshold=-30.):
+    """ Return the times at which a trace crosses a threshold upwards. """
+    i = np.where((v[:-1] < threshold) & (v[1:] >= threshold))[0]
+    return t[i] + (threshold - v[i]) / (v[i + 1] - v[i]) * (t[i + 1] - t[i])
+
+
+def main():
+    """ Script comparing the integration time and the accuracy of simulations with the
+    rate constants of the MRGnode mechanism evaluated analytically or interpolated from
+    precomputed tables.
+    """
+
+    fiberDiameter = 20  # um
+    stimulationAmplitude = -80  # uA
+    stimulationFrequency = 100  # Hz
+    pulseWidth = 0.1  # ms
+    if len(sys.argv) > 1:
+        tstop = float(sys.argv[1])  # ms
+    else:
+        tstop = 50  # ms
+
+    simulationTimes, traces = {}, {}
+    for rateTables in [False, True]:
+        set_rate_tables(rateTables)
+        simulation = MyelinatedFiberStimulation(
+            fiberDiameter, stimulationAmplitude, stimulationFrequency, tstop, pulseWidth)
+        simulation.run()
+        simulationTimes[rateTables] = simulation.simulationTime
+        traces[rateTables] = (simulation.tvec, np.asarray(simulation._membranPot))
+    set_rate_tables(False)
+
+    nSteps = int(round(tstop / simulation.dt))
+    (t, vAnalytic), (_, vTables) = traces[False], traces[True]
+    spikesAnalytic, spikesTables = (crossing_times(t, v[-1]) for v in (vAnalytic, vTables))
+
+    print("\nIntegration time per step:")
+    for rateTables, label in [(False, "analytic rates"), (True, "tabulated rates")]:
+        print("\t%s: %.1f us" % (label, simulationTimes[rateTables] / nSteps * 1e6))
+    print("\tspeedup: x%.2f" % (simulationTimes[False] / simulationTimes[True]))
+    print("\nAccuracy of tabulated rates:")
+    print("\tmaximal deviation of nodal potentials: %.2e mV" % (np.abs(vTables - vAnalytic).max()))
+    if spikesAnalytic.size == spikesTables.size:
+        print("\t%d spikes at end node, maximal time deviation: %.2e ms" % (
+            spikesAnalytic.size, np.abs(spikesTables - spikesAnalytic).max(initial=0.)))
+    else:
+        print("\tspike counts at end node differ: %d (analytic) vs %d (tabulated)" % (
+            spikesAnalytic.size, spikesTables.size))
+
+
+if __name__ == '__main__':
+    main()
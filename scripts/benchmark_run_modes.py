@@ -0,0 +1,35 @@
+import sys
+
+from FNE_NEURON.simulations import MyelinatedFiberStimulation
+
+
+def main():
+    """ Script comparing the wall time of a simulation integrated natively (continuerun)
+    with that of the same simulation advanced step by step from Python.
+    """
+
+    fiberDiameter = 20  # um
+    stimulationAmplitude = -80  # uA
+    stimulationFrequency = 100  # Hz
+    pulseWidth = 0.1  # ms
+    if len(sys.argv) > 1:
+        tstop = float(sys.argv[1])  # ms
+    else:
+        tstop = 50  # ms
+
+    simulationTimes = {}
+    for stepwise in [True, False]:
+        simulation = MyelinatedFiberStimulation(
+            fiberDiameter, stimulationAmplitude, stimulationFrequency, tstop, pulseWidth)
+        simulation.run(stepwise=stepwise)
+        simulationTimes[stepwise] = simulation.simulationTime
+
+    print("\nSimulation time:")
+    print("\tstepwise run: %.3f s" % (simulationTimes[True]))
+    print("\tnative run: %.3f s" % (simulationTimes[False]))
+    print("\tdifference: %.3f s (speedup x%.2f)" % (
+        simulationTimes[True] - simulationTimes[False], simulationTimes[True] / simulationTimes[False]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import sys
+
+import numpy as np
+
+from FNE_NEURON.simulations import MyelinatedFiberStimulation
+
+
+def crossing_times(t, v, threshold=-30.):
+    """ Return the first upward crossing times (in ms, linearly interpolated) of a
+    threshold potential by each trace, or NaN for traces not crossing it. """
+    times = np.full(len(v), np.nan)
+    for i, y in enumerate(v):
+        crossed = np.nonzero((y[:-1] < threshold) & (y[1:] >= threshold))[0]
+        if crossed.size > 0:
+            j = crossed[0]
+            times[i] = t[j] + (threshold - y[j]) / (y[j + 1] - y[j]) * (t[j + 1] - t[j])
+    return times
+
+
+def main():
+    """ Script checking variable time step (CVode) integration of an extracellularly
+    stimulated fiber against fine fixed time step integration (dt = 0.1 us), by comparing
+    the nodal membrane potentials of a subthreshold stimulation, and the spike times at
+    all nodes of a suprathreshold stimulation.
+
+    The script exits with an error if any subthreshold trace deviates by more than the
+    potential tolerance (in mV, default 0.1) given as first argument, or any spike time
+    by more than the timing tolerance (in ms, default 0.05) given as second argument.
+    Pointwise deviations of suprathreshold traces are reported but not checked, as they
+    are dominated by the slight spike timing differences.
+
+    Note that the fixed time step (0.01 ms) used by default is much less accurate around
+    stimulus discontinuities and spikes (deviations of several mV and about 0.2 ms).
+    """
+
+    vtolerance = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1  # mV
+    ttolerance = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05  # ms
+
+    fiberDiameter = 10  # um
+    amplitudes = {'subthreshold': -30, 'suprathreshold': -100}  # uA
+    pulseWidth = 0.1  # ms
+    tstop = 3  # ms
+    referenceDt = 1e-4  # ms
+    outputDt = 1e-3  # ms
+
+    failures = []
+    print("\n  stimulation      I (uA)  max |dV| (mV)  max |dt spike| (ms)  time (fixed / cvode, s)")
+    for label, amplitude in amplitudes.items():
+        traces, times, durations = {}, {}, {}
+        for method in ['fixed', 'cvode']:
+            simulation = MyelinatedFiberStimulation(fiberDiameter, amplitude, 0, tstop, pulseWidth,
+                                                    integrationMethod=method, outputDt=outputDt,
+                                                    reuseFiber=True)
+            if method == 'fixed':
+                simulation.dt = referenceDt
+            simulation.run()
+            traces[method] = np.asarray(simulation._membranPot)
+            times[method] = crossing_times(simulation.tvec, traces[method])
+            durations[method] = simulation.simulationTime
+        # Compare traces over their common output times
+        n = min(traces['fixed'].shape[1], traces['cvode'].shape[1])
+        verror = np.abs(traces['cvode'][:, :n] - traces['fixed'][:, :n]).max()
+        spiking = ~np.isnan(times['fixed'])
+        if np.any(spiking != ~np.isnan(times['cvode'])):
+            terror = np.inf
+        else:
+            terror = np.abs(times['cvode'] - times['fixed'])[spiking].max(initial=0.)
+        print("  %-15s  %6.0f  %13.2e  %19.2e  %.2f / %.2f" % (
+            label, amplitude, verror, terror, durations['fixed'], durations['cvode']))
+        if not spiking.any() and verror > vtolerance:
+            failures.append("%s traces deviate by %.2e mV > %.2e mV" % (label, verror, vtolerance))
+        if terror > ttolerance:
+            failures.append("%s spike times deviate by %.2e ms > %.2e ms" % (label, terror, ttolerance))
+
+    if failures:
+        sys.exit("check failed: " + ", ".join(failures))
+    print("check passed")
+
+
+if __name__ == '__main__':
+    main()
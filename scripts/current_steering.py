@@ -0,0 +1,61 @@
+import sys
+
+import numpy as np
+
+from FNE_NEURON.cells import MyelinatedFiber
+from FNE_NEURON.simulations import ElectrodeArray, MyelinatedFiberStimulation, compute_contact_polarizations
+from FNE_NEURON.simulations.activation import thresholdDepolarization, chronaxie
+
+
+def main():
+    """ Script steering the current between two neighbouring contacts of a four-contact
+    cuff, to selectively activate one of two fibers located near each contact.
+
+    Contact weightings are screened from the passive nodal polarization induced by each
+    contact, by matrix-vector products, and the most selective weighting is then checked
+    with NEURON simulations reusing the precomputed contact unit fields.
+    """
+
+    if len(sys.argv) > 1:
+        nWeightings = int(sys.argv[1])
+    else:
+        nWeightings = 11
+    fiberDiameter = 10  # um
+    pulseWidth = 0.1  # ms
+    cuffRadius = 500  # um
+    fiberPositions = np.array([[350., 0.], [0., 350.]])  # um, near the first two contacts
+
+    cuff = ElectrodeArray.cuff(4, cuffRadius)
+    fiber = MyelinatedFiber(fiberDiameter)
+    polarizations = [compute_contact_polarizations(fiber, cuff, position) for position in fiberPositions]
+
+    # Predicted cathodic thresholds of both fibers for each weighting of the first two contacts
+    alpha = np.linspace(0, 1, nWeightings)
+    weights = np.zeros((nWeightings, 4))
+    weights[:, 0], weights[:, 1] = 1 - alpha, alpha
+    thresholds = np.array([thresholdDepolarization[-1] * (1 + chronaxie / pulseWidth) / (-weights @ P).max(axis=1)
+                           for P in polarizations]).T
+
+    print("\nPredicted thresholds (uA):")
+    print("\tweight 1   weight 2   fiber 1   fiber 2")
+    for w, (th1, th2) in zip(weights, thresholds):
+        print("\t%8.2f   %8.2f   %7.1f   %7.1f" % (w[0], w[1], th1, th2))
+
+    # Check the weighting maximizing the threshold ratio between both fibers
+    best = np.argmax(thresholds[:, 1] / thresholds[:, 0])
+    cuff.set_weights(weights[best])
+    amplitude = -1.2 * thresholds[best, 0]
+    activated = []
+    for y, z in fiberPositions:
+        simulation = MyelinatedFiberStimulation(fiberDiameter, amplitude, 0, 5, pulseWidth, reuseFiber=True)
+        simulation.fibersPosition = 0.
+        simulation.set_electrode(ElectrodeArray(cuff.positions - [0., y, z], cuff.weights))
+        simulation.set_spike_detection()
+        simulation.run()
+        activated.append(simulation.propagated)
+    print("\nweights %s at %.1f uA: fiber 1 %s, fiber 2 %s" % (
+        np.round(weights[best], 2), amplitude, *["activated" if x else "not activated" for x in activated]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import sys
+
+from FNE_NEURON.simulations import discretization_convergence
+
+
+def main():
+    """ Script reporting how the activation threshold of a fiber changes with its number
+    of nodes and of segments per section, and selecting the cheapest discretization
+    whose threshold lies within 1% of that of the finest one.
+    """
+
+    if len(sys.argv) > 1:
+        fiberDiameter = float(sys.argv[1])  # um
+    else:
+        fiberDiameter = 10  # um
+    distance = 100  # um
+    pulseWidth = 0.1  # ms
+    nNodes = [11, 21, 41, 'auto', 101]
+    nseg = [1, 3, 5]
+    target = 0.01
+
+    table, best = discretization_convergence(fiberDiameter, pulseWidth, distance, nNodes, nseg, target)
+    print(table.to_string(index=False))
+    if best is None:
+        print("\nno discretization within %.1f%% of the reference threshold" % (target * 100))
+    else:
+        print("\ncheapest discretization within %.1f%%: %d nodes, nseg = %s (%d compartments)" % (
+            target * 100, best['nNodes'], best['nseg'], best['nCompartments']))
+
+
+if __name__ == '__main__':
+    main()
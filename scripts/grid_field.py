@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from FNE_NEURON.simulations import ElectrodeArray, GridField, MyelinatedFiberStimulation
+from FNE_NEURON.simulations.activation import point_source_field
+
+
+def main():
+    """ Script stimulating a fiber with an externally computed extracellular field,
+    loaded from a memory-mapped grid.
+
+    For the sake of the example, the grid is filled with the field of a point source,
+    saved if not already present, and the resulting simulation is compared to that of
+    the analytic point source. A curved fiber trajectory is then simulated in the same
+    field, reusing the loaded grid.
+    """
+
+    if len(sys.argv) > 1:
+        gridDir = sys.argv[1]
+    else:
+        gridDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grids', 'point_source')
+    fiberDiameter = 10  # um
+    amplitude = -80  # uA
+    pulseWidth = 0.1  # ms
+    tstop = 5  # ms
+
+    if not os.path.isdir(gridDir):
+        # Fine grid around the electrode, coarser along the fiber ends
+        x = np.unique(np.concatenate((np.linspace(-60e3, 60e3, 601), np.linspace(-2e3, 2e3, 801))))
+        y, z = np.linspace(20, 420, 41), np.linspace(-200, 200, 41)  # away from the source
+        X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+        potential = point_source_field(X, np.sqrt(Y**2 + Z**2), sigma=2.)
+        GridField.save(gridDir, x, y, z, potential, units='mV/uA')
+        print("Saved %d x %d x %d grid in %s" % (x.size, y.size, z.size, gridDir))
+    start = time.time()
+    field = GridField.load(gridDir)
+    print("Loaded %s in %.3f s" % (field, time.time() - start))
+
+    potentials = {}
+    for label, electrode in [("point source", None), ("grid field", ElectrodeArray([field]))]:
+        simulation = MyelinatedFiberStimulation(fiberDiameter, amplitude, 0, tstop, pulseWidth, reuseFiber=True)
+        simulation.set_electrode(electrode)
+        simulation.run()
+        potentials[label] = np.asarray(simulation._membranPot)
+    print("\tmaximal deviation of membrane potentials: %.2e mV" % (
+        np.abs(potentials["grid field"] - potentials["point source"]).max()))
+
+    # Fiber bending away from the electrode
+    simulation = MyelinatedFiberStimulation(fiberDiameter, amplitude, 0, tstop, pulseWidth, reuseFiber=True)
+    simulation.set_electrode(ElectrodeArray([field]))
+    simulation.set_trajectory([[-60e3, 100., 0.], [-500., 100., 0.], [500., 300., 0.], [60e3, 300., 0.]])
+    simulation.set_spike_detection()
+    simulation.run()
+    print("\tcurved fiber: %s" % ("activated" if simulation.propagated else "not activated"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import sys
+
+import numpy as np
+
+from FNE_NEURON.simulations import run_sweep
+
+
+def main():
+    """ Script running a parameter sweep of extracellular stimulations of myelinated
+    fibers, and saving a summary of the fibers responses in a csv file.
+
+    The sweep runs over a local pool of processes, or over MPI ranks if the script
+    is launched with MPI:
+        mpiexec -n <number of ranks> python sweep.py
+    """
+
+    if len(sys.argv) > 1:
+        name = sys.argv[1]
+    else:
+        name = "sweep"
+
+    fiberDiameters = [5, 10, 15, 20]  # um
+    stimulationAmplitudes = -np.logspace(1, 3, 10)  # uA
+    pulseWidths = [0.05, 0.1, 0.2]  # ms
+    stimulationFrequencies = [0, 100]  # Hz
+    tstop = 20  # ms
+    screenMargin = 3  # stimuli 3 times weaker than their predicted threshold are not simulated
+
+    results = run_sweep(fiberDiameters, stimulationAmplitudes, pulseWidths, stimulationFrequencies, tstop=tstop,
+                        screenMargin=screenMargin)
+    results.to_csv(name + ".csv", index=False)
+    print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import sys
+
+from FNE_NEURON.simulations import ThresholdTable
+
+
+def main():
+    """ Script precomputing a lookup table of activation thresholds over fiber
+    diameters, electrode-fiber distances and pulse widths, refined where the estimated
+    interpolation error exceeds 2%, and saving it in a .npz file.
+
+    The table can then be queried in milliseconds:
+        table = ThresholdTable.load('thresholds.npz')
+        threshold, error = table(diameter, distance, pulseWidth)
+    """
+
+    if len(sys.argv) > 1:
+        name = sys.argv[1]
+    else:
+        name = "thresholds"
+
+    fiberDiameters = [3, 6, 10, 15, 20]  # um
+    distances = [50, 100, 200, 500, 1000]  # um
+    pulseWidths = [0.02, 0.05, 0.1, 0.2, 0.5]  # ms
+
+    table = ThresholdTable.compute(fiberDiameters, distances, pulseWidths, tol=0.02)
+    table.save(name + ".npz")
+    print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import sys
+
+import numpy as np
+
+from FNE_NEURON.simulations import MyelinatedFiberStimulation, BatchMyelinatedFiberStimulation
+
+
+def main():
+    """ Script validating the NumPy batch engine against NEURON, by comparing the nodal
+    membrane potentials and end node spike times of single pulse stimulations of fibers
+    of various diameters, distances and amplitudes.
+
+    The script exits with an error if any trace deviates by more than the tolerance
+    (in mV, default 1e-3) given as first argument.
+    """
+
+    if len(sys.argv) > 1:
+        tolerance = float(sys.argv[1])
+    else:
+        tolerance = 1e-3  # mV
+
+    fiberDiameters = [5, 10, 20]  # um
+    distances = [100, 500]  # um
+    amplitudes = [-50, -200, 500]  # uA
+    pulseWidth = 0.1  # ms
+    tstop = 5  # ms
+
+    cases = [(d, r, a) for d in fiberDiameters for r in distances for a in amplitudes]
+    diameters, distances, amplitudes = np.array(cases).T
+    batch = BatchMyelinatedFiberStimulation(diameters, distances, amplitudes, tstop, pulseWidth)
+    batch.run()
+
+    neuronTime = 0.
+    errors = []
+    print("\n  D (um)  r (um)  I (uA)  max |dV| (mV)  spikes (NEURON / batch, ms)")
+    for i, (diameter, distance, amplitude) in enumerate(cases):
+        simulation = MyelinatedFiberStimulation(diameter, amplitude, 0, tstop, pulseWidth)
+        simulation.fibersPosition = distance
+        simulation.run()
+        neuronTime += simulation.simulationTime
+        error = np.abs(simulation._membranPot - batch.vnodes[i]).max()
+        errors.append(error)
+        vend = simulation._membranPot[-1]
+        crossed = np.nonzero((vend[1:] >= -30) & (vend[:-1] < -30))[0] + 1
+        print("  %6.1f  %6.0f  %6.0f  %13.2e  %s / %s" % (
+            diameter, distance, amplitude, error, simulation.tvec[crossed], batch.spikeTimes[i]))
+
+    print("\nIntegration time: NEURON %.2f s, batch engine %.2f s" % (neuronTime, batch.simulationTime))
+    if max(errors) > tolerance:
+        sys.exit("validation failed: maximal deviation %.2e mV > %.2e mV" % (max(errors), tolerance))
+    print("validation passed: maximal deviation %.2e mV" % max(errors))
+
+
+if __name__ == '__main__':
+    main()